@@ -1,9 +1,18 @@
+import os
+
 from python_library import create_app
+from python_library.overdue import start_scheduler
 
 app = create_app()
 
 # Bloco de execução
 if __name__ == '__main__':
+    # Varredura diária dos atrasos dentro do próprio servidor (opcional, ex.: OVERDUE_SCAN_AT=02:00).
+    # Só aqui, e não no create_app: comandos 'flask ...' e cada worker de produção não disparam a thread.
+    # Com o reloader do debug, só o processo filho (WERKZEUG_RUN_MAIN) serve as requisições.
+    if os.getenv("OVERDUE_SCAN_AT") and os.getenv("WERKZEUG_RUN_MAIN") == "true":
+        start_scheduler(app, os.getenv("OVERDUE_SCAN_AT"))
+
     # Habilitamos o 'debug=True'
     # Isso faz o servidor reiniciar automaticamente quando você salvar o arquivo.
     app.run(debug=True)
\ No newline at end of file
@@ -13,27 +13,33 @@ load_dotenv()
 # Isso evita problemas de "importação circular".
 db = SQLAlchemy()
 
-def create_app():
+def create_app(config=None):
     """
     Função 'Application Factory'.
     Ela cria e configura a instância do app Flask.
+    'config' sobrescreve a configuração (ex.: os testes passam outro SQLALCHEMY_DATABASE_URI).
     """
     app = Flask(__name__)
 
     CORS(app)
 
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    if config:
+        app.config.update(config)
+
     # --- Configuração do Banco de Dados ---
-    DB_USER = os.getenv("DB_USER")
-    DB_PASS = os.getenv("DB_PASS")
-    DB_HOST = os.getenv("DB_HOST")
-    DB_NAME = os.getenv("DB_NAME")
+    # Sem URI informada, usa o MySQL das variáveis do .env
+    if "SQLALCHEMY_DATABASE_URI" not in app.config:
+        DB_USER = os.getenv("DB_USER")
+        DB_PASS = os.getenv("DB_PASS")
+        DB_HOST = os.getenv("DB_HOST")
+        DB_NAME = os.getenv("DB_NAME")
 
-    # -- Codifica a senha --
-    safe_user = quote_plus(DB_USER)
-    safe_pass = quote_plus(DB_PASS)
+        # -- Codifica a senha --
+        safe_user = quote_plus(DB_USER)
+        safe_pass = quote_plus(DB_PASS)
 
-    app.config["SQLALCHEMY_DATABASE_URI"] = f"mysql+pymysql://{safe_user}:{safe_pass}@{DB_HOST}/{DB_NAME}"
-    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+        app.config["SQLALCHEMY_DATABASE_URI"] = f"mysql+pymysql://{safe_user}:{safe_pass}@{DB_HOST}/{DB_NAME}"
 
     # Conecta o 'db' ao 'app' que acabamos de criar
     db.init_app(app)
@@ -82,5 +88,32 @@ def create_app():
     seed.register_seed_command(app)
     # -- END OF SEED --
 
+    # -- SCHEMA INDEXES --
+    from . import indexes
+    indexes.register_indexes_command(app)
+
+    # -- BULK IMPORT --
+    from . import importer
+    importer.register_import_command(app)
+
+    # -- AVAILABILITY COUNTERS --
+    from . import availability
+    availability.register_availability_command(app)
+    # Banco com exemplares de antes da tabela de contadores: calcula tudo na subida
+    with app.app_context():
+        availability.rebuild_if_empty()
+
+    # -- INVENTORY RECONCILIATION --
+    from . import reconcile
+    reconcile.register_reconcile_command(app)
+
+    # -- OVERDUE LOANS --
+    from . import overdue
+    overdue.register_overdue_command(app)
+
+    # -- FINES --
+    from . import fines
+    fines.register_fines_command(app)
+
     # Retorna o app pronto
     return app
\ No newline at end of file
@@ -0,0 +1,179 @@
+from collections import defaultdict
+
+from sqlalchemy import case, delete, func, insert, select, update
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from . import db
+from .models import BookAvailability, Branch, PhysicalBook
+
+# Para reconstruir os contadores a partir dos exemplares
+# poetry run flask rebuild-availability
+# no terminal
+
+# Status do exemplar -> coluna do contador
+STATUS_COLUMNS = {
+    'AVAILABLE': 'Available',
+    'BORROWED': 'Borrowed',
+    'IN REPAIR': 'InRepair',
+    'LOST': 'Lost',
+}
+
+
+class AvailabilityChanges:
+    """
+    Accumulates counter deltas by (ISBN, idBranch) so a batch operation
+    writes all of them with a single statement
+    """
+
+    def __init__(self):
+        self._deltas = defaultdict(lambda: dict.fromkeys(STATUS_COLUMNS.values(), 0))
+
+    def move(self, isbn, id_branch, from_status=None, to_status=None, quantity=1):
+        """
+        Register 'quantity' copies leaving 'from_status' and entering 'to_status'
+        (None for a copy being created or moved out of the branch)
+        """
+        if from_status == to_status:
+            return
+        deltas = self._deltas[(isbn, id_branch)]
+        if from_status:
+            deltas[STATUS_COLUMNS[from_status]] -= quantity
+        if to_status:
+            deltas[STATUS_COLUMNS[to_status]] += quantity
+
+    def apply(self):
+        """Write the accumulated deltas in the current transaction (does not commit)"""
+        rows = [
+            {'ISBN': isbn, 'idBranch': id_branch, **deltas}
+            for (isbn, id_branch), deltas in self._deltas.items()
+            if any(deltas.values())
+        ]
+        if rows:
+            _increment(rows)
+        self._deltas.clear()
+
+
+def move(isbn, id_branch, from_status=None, to_status=None, quantity=1):
+    """Update the counters of one copy status change, in the current transaction"""
+    changes = AvailabilityChanges()
+    changes.move(isbn, id_branch, from_status, to_status, quantity)
+    changes.apply()
+
+
+def _increment_statement():
+    """
+    INSERT of the deltas that, when the (ISBN, idBranch) row already exists,
+    adds them to the current counters instead (None when the dialect has no upsert)
+    """
+    table = BookAvailability.__table__
+    columns = list(STATUS_COLUMNS.values())
+    dialect = db.engine.dialect.name
+
+    if dialect == 'mysql':
+        stmt = mysql_insert(BookAvailability)
+        return stmt.on_duplicate_key_update({c: table.c[c] + stmt.inserted[c] for c in columns})
+    if dialect == 'sqlite':
+        stmt = sqlite_insert(BookAvailability)
+        return stmt.on_conflict_do_update(
+            index_elements=['ISBN', 'idBranch'],
+            set_={c: table.c[c] + stmt.excluded[c] for c in columns}
+        )
+
+    return None
+
+
+def _increment(rows):
+    """Add the deltas to the counters, creating the missing (ISBN, idBranch) rows"""
+    stmt = _increment_statement()
+    if stmt is not None:
+        db.session.execute(stmt, rows)
+        return
+
+    # Outros bancos: trava a linha do contador (SELECT ... FOR UPDATE), soma nela ou insere.
+    # Sempre na mesma ordem, para duas transações não travarem linhas em ordem inversa.
+    table = BookAvailability.__table__
+    columns = list(STATUS_COLUMNS.values())
+    for row in sorted(rows, key=lambda r: (r['ISBN'], r['idBranch'])):
+        key = (table.c.ISBN == row['ISBN'], table.c.idBranch == row['idBranch'])
+        found = db.session.execute(select(table.c.ISBN).where(*key).with_for_update()).first()
+        if found:
+            db.session.execute(update(table).where(*key).values({c: table.c[c] + row[c] for c in columns}))
+        else:
+            db.session.execute(insert(table).values(row))
+
+
+def rebuild():
+    """
+    Recompute every counter from PhysicalBook with one INSERT ... SELECT
+    Used to initialize the table and to repair drift
+    """
+    columns = list(STATUS_COLUMNS.values())
+    counts = select(
+        PhysicalBook.ISBN,
+        PhysicalBook.idBranch,
+        *[func.sum(case((PhysicalBook.Status == status, 1), else_=0)) for status in STATUS_COLUMNS]
+    ).group_by(PhysicalBook.ISBN, PhysicalBook.idBranch)
+
+    db.session.execute(delete(BookAvailability))
+    db.session.execute(insert(BookAvailability).from_select(['ISBN', 'idBranch', *columns], counts))
+    db.session.commit()
+
+
+def rebuild_if_empty():
+    """
+    Initialize the counters of a database that already had copies before BookAvailability existed;
+    otherwise the first move() would start from zero and leave them negative
+    :return: <bool> True if the counters were rebuilt
+    """
+    has_counters = db.session.query(BookAvailability.ISBN).first() is not None
+    has_copies = db.session.query(PhysicalBook.idPhysicalBook).first() is not None
+    if has_counters or not has_copies:
+        db.session.rollback()
+        return False
+
+    rebuild()
+    return True
+
+
+def get_availability(isbns):
+    """
+    Counters per branch of the given books (primary key reads, no aggregation)
+    :param isbns: <list> ISBNs
+    :return: <dict> ISBN -> list of {idBranch, BranchName, Available, Borrowed, InRepair}
+    """
+    if not isbns:
+        return {}
+
+    rows = db.session.query(
+        BookAvailability,
+        Branch.BranchName
+    ).join(
+        Branch, Branch.idBranch == BookAvailability.idBranch
+    ).filter(
+        BookAvailability.ISBN.in_(isbns)
+    ).order_by(BookAvailability.idBranch)
+
+    output = defaultdict(list)
+    for counter, branch_name in rows:
+        output[counter.ISBN].append({
+            'idBranch': counter.idBranch,
+            'BranchName': branch_name,
+            'Available': counter.Available,
+            'Borrowed': counter.Borrowed,
+            'InRepair': counter.InRepair,
+        })
+
+    return output
+
+
+def register_availability_command(app):
+    """Register command 'rebuild-availability' for this application"""
+
+    @app.cli.command("rebuild-availability")
+    def rebuild_availability_command():
+        """
+        Recalcula os contadores de disponibilidade a partir dos exemplares.
+        """
+        rebuild()
+        print(">>> Contadores de disponibilidade recalculados.")
@@ -0,0 +1,176 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import request, make_response
+from sqlalchemy import event
+
+from . import db
+
+# Todos os caches criados, para a invalidação por commit
+_caches = []
+
+
+class ResponseCache:
+    """
+    In-process LRU cache invalidated when a transaction touching one of its
+    models is committed (see the session listeners below).
+    """
+
+    def __init__(self, models, maxsize=256, ttl=None):
+        """
+        :param models: <list> models whose changes invalidate this cache
+        :param maxsize: <int> max number of entries kept
+        :param ttl: <int> seconds an entry stays valid (None = until invalidated)
+        """
+        self.models = set(models)
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # key -> (expira_em, valor, modelos extras)
+        # Incrementada a cada invalidação: uma resposta calculada antes dela não entra no cache
+        self._generation = 0
+        self._watched = set()           # modelos extras de que alguma entrada depende
+        _caches.append(self)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value, _ = entry
+            if expires is not None and expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def generation(self, models=()):
+        """
+        Current generation, to be read before computing a value and passed to set()
+        :param models: <list> extra models the value will depend on
+        """
+        with self._lock:
+            self._watched.update(models)
+            return self._generation
+
+    def set(self, key, value, models=(), generation=None):
+        """
+        :param models: <list> extra models this entry depends on (besides the cache models)
+        :param generation: <int> value of generation() read before computing the value;
+            if the cache was invalidated since then the value may be stale and is not stored
+        """
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._watched.update(models)
+            self._entries[key] = (expires, value, frozenset(models))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+
+    def discard(self, models):
+        """Remove only the entries depending on one of the given extra models"""
+        with self._lock:
+            for key in [k for k, (_, _, extra) in self._entries.items() if extra & models]:
+                del self._entries[key]
+            if self._watched & models:
+                self._generation += 1
+
+
+def invalidate(*models):
+    """Clear every cache that depends on one of the given models"""
+    changed = set(models)
+    for cache in _caches:
+        if cache.models & changed:
+            cache.clear()
+        else:
+            cache.discard(changed)
+
+
+def cached_response(cache, defaults=None, depends_on=None):
+    """
+    Decorator for GET views: caches the JSON body of 200 responses by
+    normalized query args and answers If-None-Match with 304 (strong ETag)
+    :param cache: <ResponseCache> where the bodies are kept
+    :param defaults: <dict> default value of query args, so "?status=active" and "" share an entry
+    :param depends_on: function params -> extra models a response depends on (optional)
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            params = dict(defaults or {})
+            for name, value in request.args.items(multi=True):
+                if value.strip():
+                    params[name] = value.strip()
+            key = (request.endpoint, tuple(sorted(kwargs.items())), tuple(sorted(params.items())))
+
+            cached = cache.get(key)
+            if cached is not None:
+                body, etag = cached
+                response = make_response(body, 200)
+                response.mimetype = 'application/json'
+            else:
+                models = depends_on(params) if depends_on else ()
+                # Lida antes da consulta: se um commit invalidar o cache no meio dela,
+                # a resposta (talvez já antiga) é devolvida mas não fica guardada
+                generation = cache.generation(models)
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                body = response.get_data()
+                etag = hashlib.sha256(body).hexdigest()
+                cache.set(key, (body, etag), models, generation=generation)
+
+            # 'no-cache' obriga o cliente a revalidar; com o ETag a resposta vira um 304 barato
+            response.set_etag(etag)
+            response.cache_control.no_cache = True
+            return response.make_conditional(request)
+
+        return wrapper
+
+    return decorator
+
+
+# --- Invalidação por commit ---
+# Guardamos os modelos alterados na sessão e limpamos os caches só depois do commit,
+# assim um rollback não invalida nada. Uma leitura que começou antes do commit e termina
+# depois da limpeza não repopula o cache: a geração mudou e cached_response descarta o set().
+
+@event.listens_for(db.session, 'after_flush')
+def _track_flushed_models(session, flush_context):
+    changed = session.info.setdefault('changed_models', set())
+    for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+        changed.add(type(instance))
+
+
+@event.listens_for(db.session, 'do_orm_execute')
+def _track_bulk_statements(orm_execute_state):
+    # UPDATE/DELETE/INSERT em massa (db.session.execute(update(Model)...)) não passam pelo flush
+    if orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None:
+            orm_execute_state.session.info.setdefault('changed_models', set()).add(mapper.class_)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidate_after_commit(session):
+    changed = session.info.pop('changed_models', None)
+    if changed:
+        invalidate(*changed)
+
+
+@event.listens_for(db.session, 'after_transaction_end')
+def _forget_after_rollback(session, transaction):
+    # Só quando a transação externa termina: o rollback de um SAVEPOINT (begin_nested)
+    # não pode apagar os modelos alterados que ainda aguardam o commit da transação externa
+    if transaction.parent is None:
+        session.info.pop('changed_models', None)
@@ -0,0 +1,104 @@
+from . import db
+
+
+class Field:
+    """
+    One output field of a listing: the columns needed to render it
+    and the joins those columns require
+    """
+
+    def __init__(self, columns, joins=(), render=None):
+        """
+        :param columns: <list> labeled columns read from the database
+        :param joins: <list> names of the joins needed (see apply_joins)
+        :param render: function row -> value (default: the column with the field name)
+        """
+        self.columns = columns
+        self.joins = set(joins)
+        self.render = render
+
+
+def parse_fields(value, available):
+    """
+    Parse the 'fields' query param
+    "ISBN,Title" -> ['ISBN', 'Title'], empty -> every available field
+    :param available: <dict> field name -> Field
+    :raises ValueError: on unknown field names
+    """
+    if not value:
+        return list(available)
+
+    names = []
+    for name in value.split(','):
+        name = name.strip()
+        if not name or name in names:
+            continue
+        if name not in available:
+            raise ValueError(f"Unknown field '{name}'. Use: {', '.join(available)}")
+        names.append(name)
+
+    if not names:
+        return list(available)
+
+    return names
+
+
+def projection(names, available, always=()):
+    """
+    Columns and joins needed to render the given fields
+    :param always: <list> columns always selected (ex.: keyset sort columns)
+    :return: <tuple> (columns, joins)
+    """
+    columns = []
+    keys = set()
+    joins = set()
+
+    for column in list(always) + [c for name in names for c in available[name].columns]:
+        if column.key not in keys:
+            keys.add(column.key)
+            columns.append(column)
+
+    for name in names:
+        joins |= available[name].joins
+
+    return columns, joins
+
+
+def apply_joins(query, joins, join_map):
+    """
+    Add only the requested joins, in the order of join_map
+    (so a join can depend on a previous one)
+    :param join_map: <dict> name -> (target, onclause, is_outer)
+    """
+    for name, (target, onclause, is_outer) in join_map.items():
+        if name not in joins:
+            continue
+        if is_outer:
+            query = query.outerjoin(target, onclause)
+        else:
+            query = query.join(target, onclause)
+
+    return query
+
+
+def render(row, names, available):
+    """Serialize one result row with only the requested fields"""
+    output = {}
+    for name in names:
+        field = available[name]
+        output[name] = field.render(row) if field.render else getattr(row, name)
+    return output
+
+
+def names_by_id(id_column, name_column, ids):
+    """
+    Names of the given ids, for the small lookup tables (Language, Collection, Publisher...)
+    One primary-key IN query; None ids (books without collection, etc.) are skipped
+    :param ids: iterable of ids found in an aggregation
+    :return: <dict> id -> name
+    """
+    ids = [i for i in ids if i is not None]
+    if not ids:
+        return {}
+
+    return dict(db.session.query(id_column, name_column).filter(id_column.in_(ids)))
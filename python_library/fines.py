@@ -0,0 +1,287 @@
+from datetime import date
+from decimal import Decimal
+
+import click
+import numpy as np
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from . import db
+from .models import BookLoan, FinePolicy, LoanFine, PhysicalBook
+
+# Para recalcular as multas de todos os clientes (uma vez por dia, pelo cron)
+# poetry run flask calculate-fines
+# no terminal
+
+DEFAULT_CHUNK_SIZE = 10000
+
+# Regra usada pelas filiais sem FinePolicy (valores em centavos)
+DEFAULT_DAILY_RATE_CENTS = 100
+DEFAULT_GRACE_DAYS = 0
+DEFAULT_MAX_FINE_CENTS = None
+
+UPDATE_FIELDS = ['idClient', 'DaysLate', 'Amount', 'CalculatedDate']
+
+
+def _cents(value):
+    return None if value is None else int(round(value * 100))
+
+
+def _amount(cents):
+    """Cents (int or NumPy integer) -> exact Decimal for the Numeric(10, 2) columns"""
+    return Decimal(int(cents)).scaleb(-2)  # 1950 -> Decimal("19.50")
+
+
+def load_policies():
+    """
+    Fine policies as arrays sorted by idBranch, for a vectorized lookup
+    :return: <tuple> (branch ids, daily rate in cents, grace days, cap in cents - -1 for no cap)
+    """
+    policies = db.session.execute(
+        select(FinePolicy.idBranch, FinePolicy.DailyRate, FinePolicy.GraceDays, FinePolicy.MaxFine)
+        .order_by(FinePolicy.idBranch)
+    ).all()
+
+    branches = np.array([p.idBranch for p in policies], dtype=np.int64)
+    rates = np.array([_cents(p.DailyRate) for p in policies], dtype=np.int64)
+    grace = np.array([p.GraceDays for p in policies], dtype=np.int64)
+    caps = np.array([-1 if p.MaxFine is None else _cents(p.MaxFine) for p in policies], dtype=np.int64)
+    return branches, rates, grace, caps
+
+
+def compute_fines(branch_ids, due_dates, return_dates, today, policies):
+    """
+    Vectorized fine of a block of loans
+    Days late are counted until the return (or today, if still open); only the days
+    beyond the branch grace days are charged, up to the branch cap
+    :param branch_ids: <ndarray int64> branch of each loan
+    :param due_dates: <ndarray datetime64[D]> DueDate of each loan
+    :param return_dates: <ndarray datetime64[D]> ReturnDate of each loan (NaT when still open)
+    :param today: <date> reference date for open loans
+    :param policies: result of load_policies()
+    :return: <tuple> (days late, fine in cents) - both int64 arrays
+    """
+    policy_branches, policy_rates, policy_grace, policy_caps = policies
+
+    # Regra de cada empréstimo pela filial (busca binária nas filiais com regra)
+    rate = np.full(branch_ids.shape, DEFAULT_DAILY_RATE_CENTS, dtype=np.int64)
+    grace = np.full(branch_ids.shape, DEFAULT_GRACE_DAYS, dtype=np.int64)
+    cap = np.full(branch_ids.shape, -1 if DEFAULT_MAX_FINE_CENTS is None else DEFAULT_MAX_FINE_CENTS, dtype=np.int64)
+    if policy_branches.size:
+        position = np.clip(np.searchsorted(policy_branches, branch_ids), 0, policy_branches.size - 1)
+        found = policy_branches[position] == branch_ids
+        rate = np.where(found, policy_rates[position], rate)
+        grace = np.where(found, policy_grace[position], grace)
+        cap = np.where(found, policy_caps[position], cap)
+
+    end = np.where(np.isnat(return_dates), np.datetime64(today, 'D'), return_dates)
+    days_late = np.maximum((end - due_dates).astype(np.int64), 0)
+
+    amount = np.maximum(days_late - grace, 0) * rate
+    amount = np.where(cap >= 0, np.minimum(amount, cap), amount)
+    return days_late, amount
+
+
+def _upsert_statement():
+    """INSERT of the fines that replaces the existing fine of the loan (None when the dialect has no upsert)"""
+    dialect = db.engine.dialect.name
+
+    if dialect == 'mysql':
+        stmt = mysql_insert(LoanFine)
+        return stmt.on_duplicate_key_update({f: stmt.inserted[f] for f in UPDATE_FIELDS})
+    if dialect == 'sqlite':
+        stmt = sqlite_insert(LoanFine)
+        return stmt.on_conflict_do_update(
+            index_elements=['idBookLoan'],
+            set_={f: stmt.excluded[f] for f in UPDATE_FIELDS}
+        )
+
+    return None
+
+
+def _upsert(rows):
+    """Insert the fines, replacing the existing fine of each loan"""
+    stmt = _upsert_statement()
+    if stmt is not None:
+        db.session.execute(stmt, rows)
+        return
+
+    # Outros bancos: trava as multas que já existem (SELECT ... FOR UPDATE), atualiza e insere o resto
+    existing = set(db.session.execute(
+        select(LoanFine.idBookLoan)
+        .where(LoanFine.idBookLoan.in_([row['idBookLoan'] for row in rows]))
+        .with_for_update()
+    ).scalars())
+    updates = [row for row in rows if row['idBookLoan'] in existing]
+    inserts = [row for row in rows if row['idBookLoan'] not in existing]
+    if updates:
+        # UPDATE em lote pela chave primária
+        db.session.execute(update(LoanFine), updates)
+    if inserts:
+        db.session.execute(insert(LoanFine), inserts)
+
+
+def _fine_chunks(id_client=None, today=None, chunk_size=DEFAULT_CHUNK_SIZE, loan_ids=None):
+    """
+    Compute the fines of late loans (still open or returned late), reading only
+    BookLoan is read in primary-key chunks loaded into NumPy arrays, each computed at once
+    LOST loans are left out: their fine was closed by close_fines when they were lost
+    :return: generator of (loan ids, client ids, days late, fine in cents) - one per chunk
+    """
+    today = today or date.today()
+    policies = load_policies()
+    last_id = 0
+
+    while True:
+        query = select(
+            BookLoan.idBookLoan,
+            BookLoan.idClient,
+            PhysicalBook.idBranch,
+            BookLoan.DueDate,
+            BookLoan.ReturnDate
+        ).join(
+            PhysicalBook, BookLoan.idPhysicalBook == PhysicalBook.idPhysicalBook
+        ).where(
+            BookLoan.idBookLoan > last_id,
+            BookLoan.Status.in_(['ACTIVE', 'RETURNED']),
+            BookLoan.DueDate < today
+        ).order_by(
+            BookLoan.idBookLoan
+        ).limit(chunk_size)
+        if id_client is not None:
+            query = query.where(BookLoan.idClient == id_client)
+        if loan_ids is not None:
+            query = query.where(BookLoan.idBookLoan.in_(loan_ids))
+
+        rows = db.session.execute(query).all()
+        if not rows:
+            return
+        last_id = rows[-1].idBookLoan
+
+        ids, client_ids, branch_ids, due_dates, return_dates = zip(*rows)
+        days_late, amount = compute_fines(
+            np.array(branch_ids, dtype=np.int64),
+            np.array(due_dates, dtype='datetime64[D]'),
+            np.array(return_dates, dtype='datetime64[D]'),
+            today,
+            policies
+        )
+        yield ids, client_ids, days_late, amount
+
+
+def client_fines(id_client, today=None):
+    """
+    Current fines of one client, computed on the fly without writing LoanFine
+    (except for LOST loans, whose fine was closed in LoanFine by close_fines)
+    :param id_client: <int> client id
+    :param today: <date> reference date (default: today)
+    :return: <list> of {'idBookLoan', 'DaysLate', 'Amount', 'CalculatedDate'} ordered by loan
+    """
+    today = today or date.today()
+    fines = []
+
+    for loan_ids, _, days_late, amount in _fine_chunks(id_client, today):
+        fines.extend(
+            {
+                'idBookLoan': loan_ids[i],
+                'DaysLate': int(days_late[i]),
+                'Amount': _amount(amount[i]),
+                'CalculatedDate': today
+            }
+            for i in np.flatnonzero(amount > 0).tolist()
+        )
+
+    # Multas já fechadas dos empréstimos perdidos (gravadas por close_fines)
+    lost = db.session.execute(
+        select(LoanFine.idBookLoan, LoanFine.DaysLate, LoanFine.Amount, LoanFine.CalculatedDate)
+        .join(BookLoan, BookLoan.idBookLoan == LoanFine.idBookLoan)
+        .where(LoanFine.idClient == id_client, BookLoan.Status == 'LOST')
+    ).all()
+    fines.extend(row._asdict() for row in lost)
+    fines.sort(key=lambda fine: fine['idBookLoan'])
+
+    return fines
+
+
+def calculate_fines(id_client=None, today=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Recalculate the fines of late loans (still open or returned late) and write them to LoanFine
+    Each chunk of _fine_chunks is written with one upsert and one delete, in its own transaction
+    :param id_client: <int> only the loans of this client (default: every client)
+    :param today: <date> reference date (default: today)
+    :param chunk_size: <int> loans loaded per chunk
+    :return: <dict> {'date', 'loans', 'fined', 'total'} - total as a Decimal in currency units
+    """
+    today = today or date.today()
+    report = {'date': today.isoformat(), 'loans': 0, 'fined': 0, 'total': 0}
+    total_cents = 0
+
+    for loan_ids, client_ids, days_late, amount in _fine_chunks(id_client, today, chunk_size):
+        fined = _write_fines(loan_ids, client_ids, days_late, amount, today)
+        db.session.commit()
+
+        report['loans'] += len(loan_ids)
+        report['fined'] += fined
+        total_cents += int(amount.sum())
+
+    # Encerra a transação da última leitura (sem empréstimos)
+    db.session.rollback()
+    report['total'] = _amount(total_cents)
+    return report
+
+
+def close_fines(loan_ids, today=None):
+    """
+    Write the final fine of ACTIVE loans that are about to become LOST (does not commit)
+    Call it before changing the Status: calculate_fines skips LOST loans, so the fine
+    stays at the days late up to the loss instead of being left at its last daily value
+    :param loan_ids: <list> ids of the loans being lost
+    :param today: <date> date of the loss (default: today)
+    """
+    today = today or date.today()
+    for loan_ids, client_ids, days_late, amount in _fine_chunks(today=today, loan_ids=loan_ids):
+        _write_fines(loan_ids, client_ids, days_late, amount, today)
+
+
+def _write_fines(loan_ids, client_ids, days_late, amount, today):
+    """Upsert the fines of one chunk and delete the ones that dropped to zero (does not commit)"""
+    fined = np.flatnonzero(amount > 0)
+    if fined.size:
+        _upsert([
+            {
+                'idBookLoan': loan_ids[i],
+                'idClient': client_ids[i],
+                'DaysLate': int(days_late[i]),
+                'Amount': _amount(amount[i]),
+                'CalculatedDate': today
+            }
+            for i in fined.tolist()
+        ])
+
+    # Multas que deixaram de existir (ex.: regra da filial alterada)
+    cleared = [loan_ids[i] for i in np.flatnonzero(amount == 0).tolist()]
+    if cleared:
+        db.session.execute(
+            delete(LoanFine)
+            .where(LoanFine.idBookLoan.in_(cleared))
+            .execution_options(synchronize_session=False)
+        )
+
+    return int(fined.size)
+
+
+def register_fines_command(app):
+    """Register command 'calculate-fines' for this application"""
+
+    @app.cli.command("calculate-fines")
+    @click.option("--date", "today", type=click.DateTime(formats=['%Y-%m-%d']), default=None,
+                  help="Reference date (default: today)")
+    @click.option("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, show_default=True)
+    def calculate_fines_command(today, chunk_size):
+        """
+        Recalcula as multas de todos os empréstimos atrasados.
+        """
+        report = calculate_fines(today=today.date() if today else None, chunk_size=chunk_size)
+        print(f">>> {report['date']}: {report['loans']} empréstimos atrasados, "
+              f"{report['fined']} com multa, total {report['total']:.2f}.")
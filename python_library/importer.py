@@ -0,0 +1,204 @@
+import csv
+import io
+import json
+import logging
+
+import click
+from sqlalchemy import insert
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import SQLAlchemyError
+
+from . import db
+from .models import Book
+from .search import reset_indexes
+
+# Para executar a importação
+# poetry run flask import-books livros.csv
+# no terminal
+
+BOOK_FIELDS = ['ISBN', 'Title', 'idAuthor', 'idPublisher', 'Edition', 'Language', 'Collection', 'AgeRange']
+REQUIRED_FIELDS = ['ISBN', 'Title', 'idAuthor', 'idPublisher', 'Language']
+INTEGER_FIELDS = ['idAuthor', 'idPublisher', 'Language', 'Collection', 'AgeRange']
+
+# Campos atualizados quando o ISBN já existe (upsert)
+UPDATE_FIELDS = [f for f in BOOK_FIELDS if f != 'ISBN']
+
+DEFAULT_BATCH_SIZE = 1000
+
+# Limite de erros detalhados no relatório (os demais só entram na contagem)
+MAX_REPORTED_ERRORS = 1000
+
+
+def iter_rows(stream, fmt):
+    """
+    Read the input incrementally, one row at a time
+    :param stream: binary file-like object
+    :param fmt: <str> 'csv' or 'jsonl'
+    :return: generator of (line_number, dict) - dict is None when the line can't be parsed
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, row
+    elif fmt == 'jsonl':
+        for line_number, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield line_number, row if isinstance(row, dict) else None
+    else:
+        raise ValueError("Invalid format. Use 'csv' or 'jsonl'.")
+
+
+def validate_row(raw):
+    """
+    Validate and convert one input row
+    :return: <tuple> (row, None) when valid, (None, error message) otherwise
+    """
+    if raw is None:
+        return None, "Malformed line"
+
+    row = {}
+    for field in BOOK_FIELDS:
+        value = raw.get(field)
+        if isinstance(value, str):
+            value = value.strip()
+        row[field] = value if value not in ('', None) else None
+
+    for field in REQUIRED_FIELDS:
+        if row[field] is None:
+            return None, f"Required field {field} is missing"
+
+    # O ISBN pode vir com '-', assim como no cadastro unitário
+    row['ISBN'] = str(row['ISBN']).replace('-', '')
+    if not row['ISBN'].isalnum() or len(row['ISBN']) > 13:
+        return None, "Invalid ISBN"
+
+    for field in INTEGER_FIELDS:
+        if row[field] is not None:
+            try:
+                row[field] = int(row[field])
+            except (TypeError, ValueError):
+                return None, f"Field {field} must be an integer"
+
+    return row, None
+
+
+def upsert_statement():
+    """INSERT ... that updates the existing book when the ISBN is already registered"""
+    dialect = db.engine.dialect.name
+
+    if dialect == 'mysql':
+        stmt = mysql_insert(Book)
+        return stmt.on_duplicate_key_update({f: stmt.inserted[f] for f in UPDATE_FIELDS})
+    if dialect == 'sqlite':
+        stmt = sqlite_insert(Book)
+        return stmt.on_conflict_do_update(
+            index_elements=['ISBN'],
+            set_={f: stmt.excluded[f] for f in UPDATE_FIELDS}
+        )
+
+    return insert(Book)
+
+
+def import_books(stream, fmt='csv', batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Stream a CSV / JSON Lines file into the Book table.
+    Rows are upserted in batches (executemany), one commit per batch, so memory
+    stays flat. Invalid rows are reported and skipped instead of aborting.
+    :param stream: binary file-like object
+    :param fmt: <str> 'csv' or 'jsonl'
+    :param batch_size: <int> rows per INSERT batch
+    :return: <dict> report with counts and per-row errors
+    """
+    report = {'processed': 0, 'imported': 0, 'failed': 0, 'errors': []}
+    stmt = upsert_statement()
+    batch = []
+
+    try:
+        for line_number, raw in iter_rows(stream, fmt):
+            report['processed'] += 1
+            row, error = validate_row(raw)
+            if error:
+                _report_error(report, line_number, raw, error)
+                continue
+
+            batch.append((line_number, row))
+            if len(batch) >= batch_size:
+                _write_batch(stmt, batch, report)
+                batch = []
+
+        if batch:
+            _write_batch(stmt, batch, report)
+    finally:
+        # Livros novos/alterados: os índices em memória são reconstruídos na próxima busca
+        if report['imported']:
+            reset_indexes()
+
+    return report
+
+
+def _write_batch(stmt, batch, report):
+    try:
+        db.session.execute(stmt, [row for _, row in batch])
+        db.session.commit()
+        report['imported'] += len(batch)
+        return
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        logging.warning(f"Import batch failed, retrying row by row: {e}")
+
+    # O lote falhou (ex.: autor inexistente): gravamos linha a linha
+    # com SAVEPOINT para descobrir quais linhas têm problema
+    for line_number, row in batch:
+        try:
+            with db.session.begin_nested():
+                db.session.execute(stmt, [row])
+            report['imported'] += 1
+        except SQLAlchemyError as e:
+            _report_error(report, line_number, row, str(getattr(e, 'orig', e)))
+    db.session.commit()
+
+
+def _report_error(report, line_number, row, error):
+    report['failed'] += 1
+    if len(report['errors']) < MAX_REPORTED_ERRORS:
+        report['errors'].append({
+            'line': line_number,
+            'ISBN': row.get('ISBN') if row else None,
+            'error': error
+        })
+
+
+def guess_format(filename):
+    """Infer the import format from the file extension"""
+    name = (filename or '').lower()
+    if name.endswith(('.jsonl', '.ndjson')):
+        return 'jsonl'
+    return 'csv'
+
+
+def register_import_command(app):
+    """Register command 'import-books' for this application"""
+
+    @app.cli.command("import-books")
+    @click.argument("path", type=click.Path(exists=True, dir_okay=False))
+    @click.option("--format", "fmt", type=click.Choice(['csv', 'jsonl']), default=None,
+                  help="Input format (default: from the file extension)")
+    @click.option("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, show_default=True)
+    def import_books_command(path, fmt, batch_size):
+        """
+        Importa livros de um arquivo CSV ou JSON Lines (upsert por ISBN).
+        """
+        with open(path, 'rb') as stream:
+            report = import_books(stream, fmt or guess_format(path), batch_size)
+
+        print(f">>> {report['processed']} linhas lidas, {report['imported']} importadas, {report['failed']} com erro.")
+        for error in report['errors']:
+            print(f"    Linha {error['line']} (ISBN {error['ISBN']}): {error['error']}")
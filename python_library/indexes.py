@@ -0,0 +1,50 @@
+from sqlalchemy import inspect
+
+from . import db
+
+# Para criar, num banco já existente, os índices declarados nos modelos
+# poetry run flask create-indexes
+# no terminal
+#
+# O db.create_all() só cria tabelas novas: índices adicionados a uma tabela que já existe
+# (ex.: os FULLTEXT da busca do catálogo) precisam deste comando.
+
+
+def create_indexes():
+    """
+    Create every index declared in the models that doesn't exist in the database yet
+    :return: <tuple> (created, existing) - lists of 'Table.index' names
+    """
+    created = []
+    existing = []
+
+    with db.engine.begin() as connection:
+        inspector = inspect(connection)
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            current = {index['name'] for index in inspector.get_indexes(table.name)}
+            for index in sorted(table.indexes, key=lambda index: index.name):
+                name = f"{table.name}.{index.name}"
+                if index.name in current:
+                    existing.append(name)
+                else:
+                    index.create(connection)
+                    created.append(name)
+
+    return created, existing
+
+
+def register_indexes_command(app):
+    """Register command 'create-indexes' for this application"""
+
+    @app.cli.command("create-indexes")
+    def create_indexes_command():
+        """
+        Cria os índices dos modelos que ainda não existem no banco.
+        """
+        created, existing = create_indexes()
+
+        for name in created:
+            print(f"    Criado: {name}")
+        print(f">>> {len(created)} índices criados, {len(existing)} já existiam.")
@@ -16,6 +16,10 @@ class Language(db.Model):
 
 class Author(db.Model):
     __tablename__ = "Author"
+    __table_args__ = (
+        # Índice invertido usado pela busca textual do catálogo
+        db.Index('ft_author_name', 'FName', 'LName', mysql_prefix='FULLTEXT'),
+    )
 
     idAuthor = db.Column(db.Integer, primary_key=True)
     FName = db.Column(db.String(100), nullable=False)
@@ -50,6 +54,10 @@ class Address(db.Model):
 
 class Publisher(db.Model):
     __tablename__ = "Publisher"
+    __table_args__ = (
+        # Índice invertido usado pela busca textual do catálogo
+        db.Index('ft_publisher_name', 'Name', mysql_prefix='FULLTEXT'),
+    )
 
     idPublisher = db.Column(db.Integer, primary_key=True)
     CNPJ = db.Column(db.String(14), unique=True, nullable=False)
@@ -134,6 +142,13 @@ class Branch(db.Model):
 
 class Book(db.Model):
     __tablename__ = "Book"
+    __table_args__ = (
+        # Índice usado pela paginação por cursor do catálogo (Title, ISBN)
+        db.Index('ix_book_title_isbn', 'Title', 'ISBN'),
+        # Índice invertido usado pela busca textual do catálogo
+        db.Index('ft_book_title', 'Title', mysql_prefix='FULLTEXT'),
+    )
+
     ISBN = db.Column(db.String(13), primary_key=True)
     Title = db.Column(db.String(255), nullable=False)
     idAuthor = db.Column(db.Integer, db.ForeignKey('Author.idAuthor'), nullable=False)
@@ -158,6 +173,14 @@ class Book(db.Model):
 
 class PhysicalBook(db.Model):
     __tablename__ = "PhysicalBook"
+    __table_args__ = (
+        # Índices da listagem filtrada de exemplares (prateleira da filial, exemplares de um título).
+        # No InnoDB a chave primária entra no fim de todo índice secundário,
+        # então o filtro e a paginação por idPhysicalBook usam o mesmo índice.
+        db.Index('ix_physicalbook_branch_status', 'idBranch', 'Status'),
+        db.Index('ix_physicalbook_isbn_status', 'ISBN', 'Status'),
+    )
+
     idPhysicalBook = db.Column(db.Integer, primary_key=True)
     ISBN = db.Column(db.String(13), db.ForeignKey('Book.ISBN'), nullable=False)
     idBranch = db.Column(db.Integer, db.ForeignKey('Branch.idBranch'), nullable=False)
@@ -168,8 +191,32 @@ class PhysicalBook(db.Model):
     branch = db.relationship('Branch', back_populates='physical_books')
     book_loans = db.relationship('BookLoan', back_populates='physical_book')
 
+class BookAvailability(db.Model):
+    # Contadores de exemplares por status, por livro e filial.
+    # Mantidos na mesma transação que altera PhysicalBook.Status (ver availability.py),
+    # para a consulta de disponibilidade não precisar agregar PhysicalBook.
+    __tablename__ = "BookAvailability"
+    ISBN = db.Column(db.String(13), db.ForeignKey('Book.ISBN'), primary_key=True)
+    idBranch = db.Column(db.Integer, db.ForeignKey('Branch.idBranch'), primary_key=True)
+    Available = db.Column(db.Integer, nullable=False, default=0)
+    Borrowed = db.Column(db.Integer, nullable=False, default=0)
+    InRepair = db.Column(db.Integer, nullable=False, default=0)
+    Lost = db.Column(db.Integer, nullable=False, default=0)
+
+    # -- Relacionamentos --
+    book = db.relationship('Book')
+    branch = db.relationship('Branch')
+
 class BookLoan(db.Model):
     __tablename__ = "BookLoan"
+    __table_args__ = (
+        # Índices da listagem de empréstimos ("meus empréstimos", histórico do exemplar)
+        # e da busca de atrasados (Status = 'ACTIVE' AND DueDate < hoje)
+        db.Index('ix_bookloan_client_status', 'idClient', 'Status'),
+        db.Index('ix_bookloan_status_duedate', 'Status', 'DueDate'),
+        db.Index('ix_bookloan_copy_borrowed', 'idPhysicalBook', 'BorrowedDate'),
+    )
+
     idBookLoan = db.Column(db.Integer, primary_key=True)
     idPhysicalBook = db.Column(db.Integer, db.ForeignKey('PhysicalBook.idPhysicalBook'), nullable=False)
     idClient = db.Column(db.Integer, db.ForeignKey('Client.idClient'), nullable=False)
@@ -183,6 +230,54 @@ class BookLoan(db.Model):
     physical_book = db.relationship('PhysicalBook', back_populates='book_loans')
     client = db.relationship('Client', back_populates='book_loans')
 
+class OverdueLoan(db.Model):
+    # Empréstimos ACTIVE com DueDate vencida, marcados uma vez por dia pelo 'flask scan-overdue'
+    # (ver overdue.py). O relatório de atrasos e o bloqueio de novos empréstimos leem esta tabela
+    # pequena em vez de percorrer BookLoan. A devolução remove a linha do empréstimo.
+    __tablename__ = "OverdueLoan"
+    __table_args__ = (
+        db.Index('ix_overdueloan_client', 'idClient'),
+    )
+
+    idBookLoan = db.Column(db.Integer, db.ForeignKey('BookLoan.idBookLoan'), primary_key=True)
+    idClient = db.Column(db.Integer, db.ForeignKey('Client.idClient'), nullable=False)
+    DueDate = db.Column(db.Date, nullable=False)
+    MarkedDate = db.Column(db.Date, nullable=False)
+
+    # -- Relacionamentos --
+    loan = db.relationship('BookLoan')
+    client = db.relationship('Client')
+
+class FinePolicy(db.Model):
+    # Regra de multa por atraso de cada filial (ver fines.py).
+    # Filiais sem regra usam os valores padrão de fines.py.
+    __tablename__ = "FinePolicy"
+    idBranch = db.Column(db.Integer, db.ForeignKey('Branch.idBranch'), primary_key=True)
+    DailyRate = db.Column(db.Numeric(10, 2), nullable=False)
+    GraceDays = db.Column(db.Integer, nullable=False, default=0)
+    MaxFine = db.Column(db.Numeric(10, 2), nullable=True)   # Sem teto quando nulo
+
+    # -- Relacionamentos --
+    branch = db.relationship('Branch')
+
+class LoanFine(db.Model):
+    # Multa calculada de cada empréstimo atrasado (em aberto ou devolvido com atraso).
+    # Recalculada em lote pelo 'flask calculate-fines'; a rota de multas do cliente só calcula, sem gravar.
+    __tablename__ = "LoanFine"
+    __table_args__ = (
+        db.Index('ix_loanfine_client', 'idClient'),
+    )
+
+    idBookLoan = db.Column(db.Integer, db.ForeignKey('BookLoan.idBookLoan'), primary_key=True)
+    idClient = db.Column(db.Integer, db.ForeignKey('Client.idClient'), nullable=False)
+    DaysLate = db.Column(db.Integer, nullable=False)
+    Amount = db.Column(db.Numeric(10, 2), nullable=False)
+    CalculatedDate = db.Column(db.Date, nullable=False)
+
+    # -- Relacionamentos --
+    loan = db.relationship('BookLoan')
+    client = db.relationship('Client')
+
 class Reserve(db.Model):
     __tablename__ = "Reserve"
     idReserve = db.Column(db.Integer, primary_key=True)
@@ -0,0 +1,121 @@
+import logging
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+import click
+from sqlalchemy import delete, exists, insert, literal, select
+
+from . import db
+from .models import BookLoan, OverdueLoan
+
+# Para marcar os empréstimos atrasados (uma vez por dia, pelo cron)
+# poetry run flask scan-overdue
+# no terminal
+# ou, no servidor de desenvolvimento (python app.py), com a variável OVERDUE_SCAN_AT=02:00 no .env
+
+
+def scan_overdue(today=None):
+    """
+    Bring OverdueLoan up to date: mark the ACTIVE loans whose DueDate passed
+    and clear the rows of loans that are no longer overdue (returned, lost or renewed)
+    Only touches the loans that changed since the last scan, so it can run at any time
+    :param today: <date> reference date (default: today)
+    :return: <dict> {'date', 'marked', 'cleared'}
+    """
+    today = today or date.today()
+
+    # 1. Remove os que deixaram de estar atrasados (percorre só a tabela pequena)
+    cleared = db.session.execute(
+        delete(OverdueLoan)
+        .where(~exists().where(
+            BookLoan.idBookLoan == OverdueLoan.idBookLoan,
+            BookLoan.Status == 'ACTIVE',
+            BookLoan.DueDate < today
+        ))
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+    # 2. Marca os novos atrasados (faixa do índice (Status, DueDate) de BookLoan)
+    marked = db.session.execute(
+        insert(OverdueLoan).from_select(
+            ['idBookLoan', 'idClient', 'DueDate', 'MarkedDate'],
+            select(BookLoan.idBookLoan, BookLoan.idClient, BookLoan.DueDate, literal(today))
+            .where(
+                BookLoan.Status == 'ACTIVE',
+                BookLoan.DueDate < today,
+                ~exists().where(OverdueLoan.idBookLoan == BookLoan.idBookLoan)
+            )
+        )
+    ).rowcount
+
+    db.session.commit()
+    return {'date': today.isoformat(), 'marked': marked, 'cleared': cleared}
+
+
+def has_overdue_loans(id_client):
+    """Return True when the client has loans marked as overdue"""
+    return db.session.query(exists().where(OverdueLoan.idClient == id_client)).scalar()
+
+
+def clear_overdue(loan_ids):
+    """Remove the overdue marks of loans being returned, in the current transaction (does not commit)"""
+    if loan_ids:
+        db.session.execute(
+            delete(OverdueLoan)
+            .where(OverdueLoan.idBookLoan.in_(loan_ids))
+            .execution_options(synchronize_session=False)
+        )
+
+
+def _seconds_until(at):
+    """Seconds from now until the next 'HH:MM'"""
+    hour, minute = (int(part) for part in at.split(':'))
+    now = datetime.now()
+    next_run = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if next_run <= now:
+        next_run += timedelta(days=1)
+    return (next_run - now).total_seconds()
+
+
+def start_scheduler(app, at):
+    """
+    Run scan_overdue once at startup and then every day at 'HH:MM', in a daemon thread
+    Alternative to the cron job for single-server setups, started only by app.py: calling it
+    from create_app would start one thread per CLI command and per worker. Running it
+    alongside the cron job is harmless (a scan only marks what isn't marked yet)
+    :param at: <str> time of the daily scan, ex. '02:00'
+    """
+    _seconds_until(at)  # valida o formato antes de subir a thread
+
+    def run():
+        while True:
+            with app.app_context():
+                try:
+                    report = scan_overdue()
+                    logging.info(f"Overdue scan: {report['marked']} marked, {report['cleared']} cleared")
+                except Exception as e:
+                    db.session.rollback()
+                    logging.error(f"Failed to scan overdue loans: {e}")
+                finally:
+                    db.session.remove()
+            time.sleep(_seconds_until(at))
+
+    thread = threading.Thread(target=run, name='overdue-scanner', daemon=True)
+    thread.start()
+    return thread
+
+
+def register_overdue_command(app):
+    """Register command 'scan-overdue' for this application"""
+
+    @app.cli.command("scan-overdue")
+    @click.option("--date", "today", type=click.DateTime(formats=['%Y-%m-%d']), default=None,
+                  help="Reference date (default: today)")
+    def scan_overdue_command(today):
+        """
+        Marca os empréstimos atrasados e limpa os que já foram resolvidos.
+        """
+        report = scan_overdue(today.date() if today else None)
+        print(f">>> {report['date']}: {report['marked']} empréstimos marcados como atrasados, "
+              f"{report['cleared']} removidos.")
@@ -0,0 +1,97 @@
+import base64
+import json
+
+from sqlalchemy import and_, or_
+
+# Limites de página usados pelas rotas de listagem
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+
+def parse_limit(value, default=DEFAULT_LIMIT, maximum=MAX_LIMIT):
+    """
+    Validate the 'limit' query param
+    :param value: <str> raw value from request.args
+    :return: <int> limit between 1 and maximum
+    :raises ValueError: if the value is not a positive integer
+    """
+    if value is None or value == '':
+        return default
+
+    limit = int(value)
+    if limit < 1:
+        raise ValueError("'limit' must be a positive integer")
+
+    return min(limit, maximum)
+
+
+def encode_cursor(values):
+    """
+    Encode the sort key of the last row of a page as an opaque cursor
+    :param values: <list> values of the sort columns
+    :return: <str> url-safe cursor
+    """
+    raw = json.dumps(list(values), separators=(',', ':'), default=str)
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, size):
+    """
+    Decode a cursor created by encode_cursor
+    :param cursor: <str> cursor received from the client
+    :param size: <int> number of sort columns expected
+    :return: <list> values of the sort columns
+    :raises ValueError: if the cursor is malformed
+    """
+    try:
+        padding = '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(cursor + padding).decode('utf-8'))
+    except (ValueError, TypeError) as e:
+        raise ValueError("Invalid 'cursor' parameter") from e
+
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("Invalid 'cursor' parameter")
+
+    return values
+
+
+def after_key(columns, values, descending=False):
+    """
+    Build the keyset condition "(col1, col2, ...) > (v1, v2, ...)"
+    Written as OR/AND so the database can seek on a composite index
+    :param columns: <list> sort columns, in order
+    :param values: <list> values decoded from the cursor
+    :param descending: <bool> True when the listing is ordered DESC
+    """
+    conditions = []
+    for i, column in enumerate(columns):
+        equal = [columns[j] == values[j] for j in range(i)]
+        step = column < values[i] if descending else column > values[i]
+        conditions.append(and_(*equal, step))
+
+    return or_(*conditions)
+
+
+def paginate(query, columns, limit, cursor=None, descending=False, key=None):
+    """
+    Apply keyset pagination to a query already ordered by 'columns'
+    :param query: <Query> query to paginate
+    :param columns: <list> sort columns, in order
+    :param limit: <int> page size
+    :param cursor: <str> cursor of the previous page (optional)
+    :param descending: <bool> True when the listing is ordered DESC
+    :param key: function that extracts the sort values from a result row
+    :return: <tuple> (rows, next_cursor)
+    """
+    if cursor:
+        query = query.filter(after_key(columns, decode_cursor(cursor, len(columns)), descending))
+
+    # Buscamos uma linha a mais para saber se existe próxima página
+    rows = query.limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(key(rows[-1]))
+
+    return rows, next_cursor
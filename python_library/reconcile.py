@@ -0,0 +1,216 @@
+import click
+from sqlalchemy import select, update
+
+from . import db
+from .availability import AvailabilityChanges
+from .fines import close_fines
+from .models import BookLoan, PhysicalBook
+
+# Para conferir (e corrigir) exemplares e empréstimos
+# poetry run flask reconcile-inventory --repair
+# no terminal
+
+DEFAULT_CHUNK_SIZE = 1000
+
+# Limite de problemas detalhados no relatório (os demais só entram na contagem)
+MAX_REPORTED_ISSUES = 1000
+
+# Tipos de inconsistência. Só os três primeiros têm correção segura:
+# - exemplar BORROWED sem empréstimo ACTIVE: volta a AVAILABLE
+# - empréstimo ACTIVE de exemplar AVAILABLE: o exemplar volta a BORROWED (o empréstimo é o registro
+#   de quem está com o livro, e assim o exemplar não é emprestado duas vezes)
+# - empréstimo ACTIVE de exemplar LOST: o empréstimo vira LOST, como em lost_loan
+# - empréstimo ACTIVE de exemplar IN REPAIR e vários empréstimos ACTIVE: só relatados
+BORROWED_WITHOUT_LOAN = 'borrowed_without_loan'
+LOAN_ON_AVAILABLE_COPY = 'loan_on_available_copy'
+LOAN_ON_LOST_COPY = 'loan_on_lost_copy'
+LOAN_ON_COPY_IN_REPAIR = 'loan_on_copy_in_repair'
+MULTIPLE_ACTIVE_LOANS = 'multiple_active_loans'
+
+ISSUE_TYPES = [
+    BORROWED_WITHOUT_LOAN,
+    LOAN_ON_AVAILABLE_COPY,
+    LOAN_ON_LOST_COPY,
+    LOAN_ON_COPY_IN_REPAIR,
+    MULTIPLE_ACTIVE_LOANS,
+]
+REPAIRABLE = {BORROWED_WITHOUT_LOAN, LOAN_ON_AVAILABLE_COPY, LOAN_ON_LOST_COPY}
+
+
+def find_issues(copies, active_loans):
+    """
+    Compare copies with their ACTIVE loans
+    :param copies: rows (idPhysicalBook, ISBN, idBranch, Status)
+    :param active_loans: rows (idBookLoan, idPhysicalBook) of ACTIVE loans of those copies
+    :return: <list> of (issue type, copy row, [idBookLoan])
+    """
+    loans_by_copy = {}
+    for loan in active_loans:
+        loans_by_copy.setdefault(loan.idPhysicalBook, []).append(loan.idBookLoan)
+
+    issues = []
+    for copy in copies:
+        loans = loans_by_copy.get(copy.idPhysicalBook, [])
+        if len(loans) > 1:
+            issues.append((MULTIPLE_ACTIVE_LOANS, copy, loans))
+        elif copy.Status == 'BORROWED' and not loans:
+            issues.append((BORROWED_WITHOUT_LOAN, copy, loans))
+        elif copy.Status == 'AVAILABLE' and loans:
+            issues.append((LOAN_ON_AVAILABLE_COPY, copy, loans))
+        elif copy.Status == 'LOST' and loans:
+            issues.append((LOAN_ON_LOST_COPY, copy, loans))
+        elif copy.Status == 'IN REPAIR' and loans:
+            issues.append((LOAN_ON_COPY_IN_REPAIR, copy, loans))
+
+    return issues
+
+
+def _read_chunk(ids=None, after=None, chunk_size=None, lock=False):
+    """
+    Read copies and their ACTIVE loans, either the next primary-key chunk or the given ids
+    With lock=True the rows are locked (FOR UPDATE) until the end of the transaction
+    """
+    copies_query = select(PhysicalBook.idPhysicalBook, PhysicalBook.ISBN, PhysicalBook.idBranch, PhysicalBook.Status)
+    if ids is not None:
+        copies_query = copies_query.where(PhysicalBook.idPhysicalBook.in_(ids))
+    else:
+        copies_query = copies_query.where(PhysicalBook.idPhysicalBook > after).limit(chunk_size)
+    copies_query = copies_query.order_by(PhysicalBook.idPhysicalBook)
+    if lock:
+        copies_query = copies_query.with_for_update()
+
+    copies = db.session.execute(copies_query).all()
+    if not copies:
+        return copies, []
+
+    # Empréstimos dos exemplares lidos (índice da chave estrangeira idPhysicalBook)
+    loans_query = select(BookLoan.idBookLoan, BookLoan.idPhysicalBook).where(BookLoan.Status == 'ACTIVE')
+    if ids is not None:
+        loans_query = loans_query.where(BookLoan.idPhysicalBook.in_(ids))
+    else:
+        loans_query = loans_query.where(
+            BookLoan.idPhysicalBook.between(copies[0].idPhysicalBook, copies[-1].idPhysicalBook)
+        )
+    if lock:
+        loans_query = loans_query.with_for_update()
+
+    return copies, db.session.execute(loans_query).all()
+
+
+def _repair(issues):
+    """Apply the safe repairs with set-based UPDATEs (does not commit)"""
+    changes = AvailabilityChanges()
+    available, borrowed, lost_loans = [], [], []
+
+    for issue, copy, loans in issues:
+        if issue == BORROWED_WITHOUT_LOAN:
+            available.append(copy.idPhysicalBook)
+            changes.move(copy.ISBN, copy.idBranch, 'BORROWED', 'AVAILABLE')
+        elif issue == LOAN_ON_AVAILABLE_COPY:
+            borrowed.append(copy.idPhysicalBook)
+            changes.move(copy.ISBN, copy.idBranch, 'AVAILABLE', 'BORROWED')
+        elif issue == LOAN_ON_LOST_COPY:
+            lost_loans.extend(loans)
+
+    for ids, old_status, new_status in ((available, 'BORROWED', 'AVAILABLE'), (borrowed, 'AVAILABLE', 'BORROWED')):
+        if ids:
+            db.session.execute(
+                update(PhysicalBook)
+                .where(PhysicalBook.idPhysicalBook.in_(ids), PhysicalBook.Status == old_status)
+                .values(Status=new_status)
+                .execution_options(synchronize_session=False)
+            )
+    if lost_loans:
+        close_fines(lost_loans)
+        db.session.execute(
+            update(BookLoan)
+            .where(BookLoan.idBookLoan.in_(lost_loans), BookLoan.Status == 'ACTIVE')
+            .values(Status='LOST')
+            .execution_options(synchronize_session=False)
+        )
+
+    changes.apply()
+
+
+def reconcile_inventory(repair=False, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Walk PhysicalBook in primary-key chunks comparing each copy Status with its ACTIVE loans
+    Every chunk is its own short transaction: only one chunk is kept in memory,
+    and with repair=True only the inconsistent rows are locked, just long enough to fix them
+    :param repair: <bool> fix the inconsistencies that have a safe repair
+    :param chunk_size: <int> copies read per chunk
+    :return: <dict> report with counts and the first issues found
+    """
+    report = {
+        'checked_copies': 0,
+        'checked_loans': 0,
+        'issues': dict.fromkeys(ISSUE_TYPES, 0),
+        'repaired': 0,
+        'details': []
+    }
+    last_id = 0
+
+    while True:
+        copies, loans = _read_chunk(after=last_id, chunk_size=chunk_size)
+        if not copies:
+            db.session.rollback()
+            break
+
+        last_id = copies[-1].idPhysicalBook
+        report['checked_copies'] += len(copies)
+        report['checked_loans'] += len(loans)
+        issues = find_issues(copies, loans)
+
+        if repair and any(issue in REPAIRABLE for issue, _, _ in issues):
+            # Relemos com trava só os exemplares com problema: algo pode ter mudado desde a leitura
+            db.session.rollback()
+            flagged = [copy.idPhysicalBook for issue, copy, _ in issues if issue in REPAIRABLE]
+            locked_issues = find_issues(*_read_chunk(ids=flagged, lock=True))
+            _repair(locked_issues)
+            db.session.commit()
+
+            repaired = {copy.idPhysicalBook for issue, copy, _ in locked_issues if issue in REPAIRABLE}
+            report['repaired'] += len(repaired)
+        else:
+            repaired = set()
+            # Encerra a transação de leitura do bloco (não segura o snapshot entre blocos)
+            db.session.rollback()
+
+        for issue, copy, loan_ids in issues:
+            report['issues'][issue] += 1
+            if len(report['details']) < MAX_REPORTED_ISSUES:
+                report['details'].append({
+                    'issue': issue,
+                    'idPhysicalBook': copy.idPhysicalBook,
+                    'ISBN': copy.ISBN,
+                    'idBranch': copy.idBranch,
+                    'Status': copy.Status,
+                    'idBookLoans': loan_ids,
+                    'repaired': copy.idPhysicalBook in repaired
+                })
+
+    return report
+
+
+def register_reconcile_command(app):
+    """Register command 'reconcile-inventory' for this application"""
+
+    @app.cli.command("reconcile-inventory")
+    @click.option("--repair", is_flag=True, help="Fix the inconsistencies that have a safe repair")
+    @click.option("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, show_default=True)
+    def reconcile_inventory_command(repair, chunk_size):
+        """
+        Confere o Status dos exemplares com os empréstimos ativos (e corrige com --repair).
+        """
+        report = reconcile_inventory(repair=repair, chunk_size=chunk_size)
+
+        print(f">>> {report['checked_copies']} exemplares e {report['checked_loans']} empréstimos ativos conferidos.")
+        for issue, count in report['issues'].items():
+            if count:
+                print(f"    {issue}: {count}")
+        if repair:
+            print(f">>> {report['repaired']} exemplares corrigidos.")
+        for detail in report['details']:
+            if not detail['repaired']:
+                print(f"    Exemplar {detail['idPhysicalBook']} ({detail['Status']}): "
+                      f"{detail['issue']} {detail['idBookLoans']}")
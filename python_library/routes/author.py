@@ -4,6 +4,7 @@ from flask import Blueprint, request, jsonify
 
 from .. import db
 from ..models import Author
+from ..search import ensure_fuzzy_loaded, fuzzy_authors, index_author
 
 # 'Blueprint' é como organizamos um grupo de rotas
 bp = Blueprint('authors', __name__, url_prefix='/api/authors')
@@ -84,6 +85,9 @@ def create_author():
         # Se tudo certo, comitar a transação
         db.session.commit()
 
+        # Atualiza o índice de sugestões em memória
+        index_author(new_author)
+
         return jsonify({'message': 'Author successfully created'}), 201
 
     except Exception as e:
@@ -111,6 +115,10 @@ def get_authors():
         default: active
         enum: ['active', 'inactive', 'all']
         description: Filter authors by is_active (active, inactive or all)
+      - name: name
+        in: query
+        type: string
+        description: Search by name ignoring accents and typos, best matches first (active authors only)
     responses:
       200:
         description: Authors list recovered successfully
@@ -143,11 +151,19 @@ def get_authors():
         # Pegamos o parâmetro da url
         # Se nada for passado, o valor padrão é 'active'
         status_filter = request.args.get('status', 'active')
+        name_filter = request.args.get('name')
 
         # 1. Fazemos a consulta unindo as 4 tabelas de Clientes
         # (Client, ClientFP, ClientJP, Address)
         query = db.session.query(Author)
 
+        # Busca aproximada pelo índice de trigramas (só autores ativos são indexados)
+        scores = {}
+        if name_filter:
+            ensure_fuzzy_loaded()
+            scores = {id_author: score for id_author, _, score in fuzzy_authors.search(name_filter)}
+            query = query.filter(Author.idAuthor.in_(scores))
+
         # Adicionamos o filtro de status
         if status_filter == 'active':
             query = query.filter(Author.is_active == True)
@@ -159,6 +175,8 @@ def get_authors():
             return jsonify({"error": "Invalid 'status' parameter. Use 'active', 'inactive', or 'all'."}), 400
 
         results = query.all()
+        if name_filter:
+            results.sort(key=lambda author: -scores[author.idAuthor])
 
         # 2. Formatamos os resultados para JSON
         output = []
@@ -167,6 +185,8 @@ def get_authors():
                 'idAuthor': author.idAuthor,
                 'Name': f"{author.LName}, {author.FName} {author.MName or ''}".strip(),
             }
+            if name_filter:
+                author_data['Score'] = scores[author.idAuthor]
             output.append(author_data)
 
         return jsonify({'authors': output}), 200
@@ -312,6 +332,7 @@ def update_author(author_id):
 
         # 5. Salvar as mudanças no banco
         db.session.commit()
+        index_author(author)
 
         return jsonify({"message": "Author updated successfully"}), 200
     except Exception as e:
@@ -353,6 +374,7 @@ def delete_author(author_id):
     # Apenas marca como inativo
     author.is_active = False
     db.session.commit()
+    index_author(author)
 
     return '', 204
 
@@ -364,8 +386,14 @@ def get_author_by_id(author_id):
         ).first()  # .first() pega apenas um
 
 def get_author_by_name(author_name):
-    return db.session.query(
-        Author
-    ).filter(
-        Author.FName == author_name
-    ).first()
\ No newline at end of file
+    """
+    Get the active author whose name best matches author_name
+    Ignores accents, case and small typos ("Jose Saramgo" -> "Saramago, José")
+    :param author_name: <str> name typed by the user
+    """
+    ensure_fuzzy_loaded()
+    matches = fuzzy_authors.search(author_name, limit=1)
+    if not matches:
+        return None
+
+    return get_author_by_id(matches[0][0])
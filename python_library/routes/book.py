@@ -1,14 +1,73 @@
+import csv
+import io
+import json
 import logging
 
-from flask import Blueprint, request, jsonify
-from sqlalchemy import or_
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+from sqlalchemy import Float, case, func, or_, select, type_coerce
 
 from .. import db
-from ..models import Book, Publisher, Author, Collection, Language
+from ..availability import get_availability
+from ..cache import ResponseCache, cached_response
+from ..fields import Field, apply_joins, names_by_id, parse_fields, projection, render
+from ..importer import guess_format, import_books
+from ..models import Book, BookAvailability, Publisher, Author, Collection, Language
+from ..pagination import parse_limit, paginate
+from ..search import (
+    ensure_fuzzy_loaded, ensure_suggestions_loaded, fulltext_match, fuzzy_authors, fuzzy_titles,
+    index_book, normalize, suggestions
+)
 
 # 'Blueprint' é como organizamos um grupo de rotas
 bp = Blueprint('books', __name__, url_prefix='/api/books')
 
+# Quantidade máxima de candidatos da busca aproximada (fuzzy)
+FUZZY_CANDIDATES = 200
+
+# Joins possíveis das listagens do catálogo (aplicados nesta ordem, só quando necessários)
+BOOK_JOINS = {
+    'author': (Author, Author.idAuthor == Book.idAuthor, False),
+    'publisher': (Publisher, Publisher.idPublisher == Book.idPublisher, False),
+    'collection': (Collection, Collection.idCollection == Book.Collection, True),
+    'language': (Language, Language.idLanguage == Book.Language, False),
+}
+
+# Campos das listagens do catálogo (?fields=ISBN,Title,...)
+BOOK_FIELDS = {
+    'ISBN': Field([Book.ISBN]),
+    'Title': Field([Book.Title]),
+    'Author': Field(
+        [Author.LName.label('AuthorLName'), Author.FName.label('AuthorFName'), Author.MName.label('AuthorMName')],
+        joins=['author'],
+        render=lambda row: f"{row.AuthorLName}, {row.AuthorFName} {row.AuthorMName or ''}".strip()
+    ),
+    'Publisher': Field([Publisher.Name.label('Publisher')], joins=['publisher']),
+    'Edition': Field([Book.Edition]),
+    'Language': Field([Language.Name.label('Language')], joins=['language']),
+    'Collection': Field([Collection.Name.label('Collection')], joins=['collection']),
+    'AgeRange': Field([Book.AgeRange]),
+    'Review': Field([Book.Review], render=lambda row: float(row.Review) if row.Review else None),
+}
+
+# Filtros de facetas (?language_id=1,2&publisher_id=3...): colunas de FK do próprio Book
+FACET_FILTERS = {
+    'language_id': Book.Language,
+    'publisher_id': Book.idPublisher,
+    'collection_id': Book.Collection,
+    'age_range': Book.AgeRange,
+}
+
+# Limites da busca em lote por ISBN
+LOOKUP_MAX_ISBNS = 5000
+LOOKUP_CHUNK_SIZE = 1000
+
+# Linhas lidas do banco por vez na exportação (cursor do lado do servidor)
+EXPORT_CHUNK_SIZE = 1000
+
+# Cache da listagem do catálogo. É limpo a cada commit que altere estes modelos;
+# o TTL limita o tempo de dados antigos quando outro processo faz a alteração.
+catalog_cache = ResponseCache([Book, Author, Publisher, Collection, Language], ttl=300)
+
 @bp.route('/', methods=['POST'])
 def create_book():
     """
@@ -106,6 +165,9 @@ def create_book():
         # 4. Se tudo certo, comitar a transação
         db.session.commit()
 
+        # Atualiza o índice de sugestões em memória
+        index_book(new_book)
+
         return jsonify({'message': 'Book successfully created'}), 201
 
     except Exception as e:
@@ -114,7 +176,93 @@ def create_book():
         logging.error(f"Failed to create book: {e}")
         return jsonify({"error": f"Failed to create book"}), 500
 
+@bp.route('/import', methods=['POST'])
+def import_catalog():
+    """
+    Endpoint for bulk importing books from a CSV or JSON Lines file
+    Rows are upserted by ISBN in batches; invalid rows are reported and skipped
+    Send the file as multipart ('file' field) or as the raw request body
+    ---
+    tags:
+        - Books
+    consumes:
+        - multipart/form-data
+        - text/csv
+        - application/x-ndjson
+    parameters:
+        - name: file
+          in: formData
+          type: file
+          description: CSV (header with the Book fields) or JSON Lines file
+        - name: format
+          in: query
+          type: string
+          enum: ['csv', 'jsonl']
+          description: Input format (default from the file extension or Content-Type, else csv)
+        - name: batch_size
+          in: query
+          type: integer
+          default: 1000
+          description: Rows per INSERT batch
+    responses:
+        200:
+            description: Import finished (see 'failed' and 'errors' for rejected rows)
+            schema:
+                type: object
+                properties:
+                    processed:
+                        type: integer
+                    imported:
+                        type: integer
+                    failed:
+                        type: integer
+                    errors:
+                        type: array
+                        items:
+                            type: object
+                            properties:
+                                line:
+                                    type: integer
+                                ISBN:
+                                    type: string
+                                error:
+                                    type: string
+        400:
+            description: Invalid format or batch size
+        500:
+            description: Internal server error
+    """
+    upload = request.files.get('file')
+    if upload is not None:
+        stream = upload.stream
+        fmt = request.args.get('format') or guess_format(upload.filename)
+    else:
+        stream = request.stream
+        fmt = request.args.get('format') or ('jsonl' if 'ndjson' in (request.content_type or '') else 'csv')
+
+    if fmt not in ('csv', 'jsonl'):
+        return jsonify({"error": "Invalid 'format' parameter. Use 'csv' or 'jsonl'."}), 400
+
+    try:
+        batch_size = parse_limit(request.args.get('batch_size'), default=1000, maximum=10000)
+    except ValueError:
+        return jsonify({"error": "Invalid 'batch_size' parameter. Use a positive integer."}), 400
+
+    try:
+        report = import_books(stream, fmt, batch_size)
+        return jsonify(report), 200
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Failed to import books: {e}")
+        return jsonify({"error": f"Failed to import books: {e}"}), 500
+
 @bp.route('/', methods=['GET'])
+@cached_response(
+    catalog_cache,
+    defaults={'status': 'active'},
+    # Páginas com disponibilidade também expiram quando os contadores mudam
+    depends_on=lambda params: [BookAvailability] if params.get('availability', '').lower() == 'true' else []
+)
 def get_books():
     """
     endpoint for getting all books
@@ -122,6 +270,7 @@ def get_books():
     - ?status=active (default)
     - ?status=inactive
     - ?status=all
+    Responses are cached and carry a strong ETag (send If-None-Match to get a 304)
     ---
     tags:
       - Books
@@ -133,27 +282,91 @@ def get_books():
         enum: ['active', 'inactive', 'all']
         description: Filter books by is_active (active, inactive or all)
 
-        - name: title
+      - name: title
         in: query
         type: string
-        description: Filter by title (parcial search)
+        description: Full-text search on the title (results ranked by relevance)
 
       - name: author
         in: query
         type: string
-        description: Filter by Author's first or last name
+        description: Full-text search on the Author's first or last name
 
       - name: publisher
         in: query
         type: string
-        description: Filter by publisher name
+        description: Full-text search on the publisher name
+
+      - name: fuzzy
+        in: query
+        type: boolean
+        default: false
+        description: Match title and author ignoring accents and typos ("Sao Paulo" finds "São Paulo")
+
+      - name: limit
+        in: query
+        type: integer
+        default: 50
+        description: Page size (max 500)
+
+      - name: cursor
+        in: query
+        type: string
+        description: Opaque cursor returned as 'next_cursor' by the previous page
+
+      - name: fields
+        in: query
+        type: string
+        description: Comma separated fields to return (default all), ex. "ISBN,Title". Only the needed columns and joins are queried
+
+      - name: facets
+        in: query
+        type: boolean
+        default: false
+        description: Also return Language / Publisher / Collection / AgeRange counts for the current filters
+
+      - name: language_id
+        in: query
+        type: string
+        description: Facet filter, comma separated Language ids
+
+      - name: publisher_id
+        in: query
+        type: string
+        description: Facet filter, comma separated Publisher ids
+
+      - name: collection_id
+        in: query
+        type: string
+        description: Facet filter, comma separated Collection ids
+
+      - name: age_range
+        in: query
+        type: string
+        description: Facet filter, comma separated AgeRange values
+
+      - name: availability
+        in: query
+        type: boolean
+        default: false
+        description: Also return available / borrowed / in repair copies per branch of each book
     responses:
       200:
         description: Books list recovered successfully
+        headers:
+          ETag:
+            type: string
+            description: Strong validator of the response body
         schema:
           type: object
           properties:
-            authors:
+            next_cursor:
+              type: string
+              description: Cursor of the next page (null on the last page)
+            facets:
+              type: object
+              description: Only with facets=true. Each facet is a list of {id, Name, count} ({value, count} for AgeRange)
+            books:
               type: array
               items:
                 type: object
@@ -185,8 +398,26 @@ def get_books():
                   Review:
                     type: decimal
                     example: 4.8
+                  Availability:
+                    type: array
+                    description: Only with availability=true
+                    items:
+                      type: object
+                      properties:
+                        idBranch:
+                          type: integer
+                        BranchName:
+                          type: string
+                        Available:
+                          type: integer
+                        Borrowed:
+                          type: integer
+                        InRepair:
+                          type: integer
+      304:
+        description: Not modified (If-None-Match matches the current ETag)
       400:
-        description: Invalid 'status' parameter
+        description: Invalid 'status', 'limit', 'cursor', 'fields' or facet parameter
         schema:
           type: object
           properties:
@@ -203,24 +434,30 @@ def get_books():
         title_filter = request.args.get('title')
         author_filter = request.args.get('author')
         publisher_filter = request.args.get('publisher')
+        fuzzy = request.args.get('fuzzy', 'false').lower() == 'true'
+        with_facets = request.args.get('facets', 'false').lower() == 'true'
+        with_availability = request.args.get('availability', 'false').lower() == 'true'
+        cursor = request.args.get('cursor')
 
-        # 1. Fazemos a consulta unindo as 4 tabelas de Clientes
-        # (Client, ClientFP, ClientJP, Address)
-        query = db.session.query(
-            Book,
-            Author,
-            Publisher,
-            Collection,
-            Language
-        ).join(
-            Author, Author.idAuthor == Book.idAuthor
-        ).join(
-            Publisher, Publisher.idPublisher == Book.idPublisher
-        ).outerjoin(
-            Collection, Collection.idCollection == Book.Collection
-        ).join(
-            Language, Language.idLanguage == Book.Language
-        )
+        try:
+            limit = parse_limit(request.args.get('limit'))
+        except ValueError:
+            return jsonify({"error": "Invalid 'limit' parameter. Use a positive integer."}), 400
+
+        try:
+            fields = parse_fields(request.args.get('fields'), BOOK_FIELDS)
+        except ValueError as e:
+            return jsonify({"error": f"Invalid 'fields' parameter. {e}"}), 400
+
+        # 1. Selecionamos só as colunas pedidas (Title e ISBN sempre, pois ordenam a paginação)
+        # e só os joins que os campos e os filtros precisam
+        columns, joins = projection(fields, BOOK_FIELDS, always=[Book.Title, Book.ISBN])
+        if author_filter and not fuzzy:
+            joins.add('author')
+        if publisher_filter:
+            joins.add('publisher')
+
+        query = apply_joins(db.session.query(*columns).select_from(Book), joins, BOOK_JOINS)
 
         # Adicionamos o filtro de status
         if status_filter == 'active':
@@ -232,51 +469,375 @@ def get_books():
         else:
             return jsonify({"error": "Invalid 'status' parameter. Use 'active', 'inactive', or 'all'."}), 400
 
-        # Filtro de Título (ILIKE = Case Insensitive, % = Contém)
-        if title_filter:
-            query = query.filter(Book.Title.ilike(f"%{title_filter}%"))
+        # Busca textual: usa os índices FULLTEXT (MATCH ... AGAINST) quando possível
+        # e cai no ILIKE quando o termo não pode ser indexado (ex.: menos de 3 letras)
+        scores = []
+
+        # Busca aproximada: os índices de trigramas devolvem os melhores candidatos,
+        # que viram um filtro IN (chave primária / FK) com a nota como relevância
+        if fuzzy and (title_filter or author_filter):
+            ensure_fuzzy_loaded()
+
+        # Filtro de Título
+        if title_filter and fuzzy:
+            matches = fuzzy_titles.search(title_filter, limit=FUZZY_CANDIDATES)
+            query = query.filter(Book.ISBN.in_([isbn for isbn, _, _ in matches]))
+            if matches:
+                scores.append(case({isbn: score for isbn, _, score in matches}, value=Book.ISBN, else_=0))
+        elif title_filter:
+            title_match = fulltext_match([Book.Title], title_filter)
+            if title_match is not None:
+                query = query.filter(title_match)
+                scores.append(title_match)
+            else:
+                query = query.filter(Book.Title.ilike(f"%{title_filter}%"))
 
         # Filtro de Editora
         if publisher_filter:
-            query = query.filter(Publisher.Name.ilike(f"%{publisher_filter}%"))
+            publisher_match = fulltext_match([Publisher.Name], publisher_filter)
+            if publisher_match is not None:
+                query = query.filter(publisher_match)
+                scores.append(publisher_match)
+            else:
+                query = query.filter(Publisher.Name.ilike(f"%{publisher_filter}%"))
 
         # Filtro de Autor (Nome ou Sobrenome)
-        if author_filter:
-            term = f"%{author_filter}%"
-            query = query.filter(or_(
-                Author.FName.ilike(f"%{author_filter}%"),
-                Author.LName.ilike(f"%{author_filter}%")
-            ))
+        if author_filter and fuzzy:
+            matches = fuzzy_authors.search(author_filter, limit=FUZZY_CANDIDATES)
+            query = query.filter(Book.idAuthor.in_([id_author for id_author, _, _ in matches]))
+            if matches:
+                scores.append(case({id_author: score for id_author, _, score in matches}, value=Book.idAuthor, else_=0))
+        elif author_filter:
+            author_match = fulltext_match([Author.FName, Author.LName], author_filter)
+            if author_match is not None:
+                query = query.filter(author_match)
+                scores.append(author_match)
+            else:
+                query = query.filter(or_(
+                    Author.FName.ilike(f"%{author_filter}%"),
+                    Author.LName.ilike(f"%{author_filter}%")
+                ))
 
-        query = query.order_by(Book.Title)
+        # Filtros de facetas: usam as FKs indexadas do Book, sem joins
+        for param, column in FACET_FILTERS.items():
+            value = request.args.get(param)
+            if not value:
+                continue
+            try:
+                values = [int(v) for v in value.split(',') if v.strip()]
+            except ValueError:
+                return jsonify({"error": f"Invalid '{param}' parameter. Use comma separated integers."}), 400
+            query = query.filter(column.in_(values))
 
-        results = query.all()
+        # Contagem das facetas com os filtros atuais (antes da paginação)
+        facets = get_facets(query) if with_facets else None
+
+        if scores:
+            # Com busca textual, ordenamos por relevância (e ISBN para desempate)
+            relevance = type_coerce(scores[0], Float)
+            for score in scores[1:]:
+                relevance = relevance + type_coerce(score, Float)
+
+            query = query.add_columns(relevance.label('relevance'))
+            query = query.order_by(relevance.desc(), Book.ISBN.desc())
+            sort_columns = [relevance, Book.ISBN]
+            descending = True
+            sort_key = lambda row: (row.relevance, row.ISBN)
+        else:
+            # Ordenação estável (Title, ISBN) para a paginação por cursor
+            query = query.order_by(Book.Title, Book.ISBN)
+            sort_columns = [Book.Title, Book.ISBN]
+            descending = False
+            sort_key = lambda row: (row.Title, row.ISBN)
+
+        try:
+            results, next_cursor = paginate(
+                query,
+                sort_columns,
+                limit,
+                cursor=cursor,
+                descending=descending,
+                key=sort_key
+            )
+        except ValueError:
+            return jsonify({"error": "Invalid 'cursor' parameter."}), 400
 
         if not results:
             return jsonify({"error": "No books found."}), 400
 
         # 2. Formatamos os resultados para JSON
         output = []
-        for book, author, publisher, collection, language in results:
-            book_data = {
-                'ISBN': book.ISBN,
-                'Title': book.Title,
-                'Author': f"{author.LName}, {author.FName} {author.MName or ''}".strip(),
-                'Publisher': publisher.Name,
-                'Edition': book.Edition,
-                'Language': language.Name,
-                'Collection': collection.Name if collection else None,
-                'AgeRange': book.AgeRange,
-                'Review': float(book.Review) if book.Review else None,
-            }
+        # Disponibilidade: leitura dos contadores mantidos, só para os ISBNs da página
+        availability = get_availability([row.ISBN for row in results]) if with_availability else {}
+
+        for row in results:
+            book_data = render(row, fields, BOOK_FIELDS)
+            if scores:
+                book_data['Relevance'] = row.relevance
+            if with_availability:
+                book_data['Availability'] = availability.get(row.ISBN, [])
             output.append(book_data)
 
-        return jsonify({'books': output}), 200
+        response = {'books': output, 'next_cursor': next_cursor}
+        if facets is not None:
+            response['facets'] = facets
+
+        return jsonify(response), 200
 
     except Exception as e:
         logging.error(f"Failed to get books: {e}")
         return jsonify({"error": f"Failed to get books"}), 500
 
+@bp.route('/export', methods=['GET'])
+def export_books():
+    """
+    Endpoint for exporting the whole catalog as a stream
+    Rows are read with a server-side cursor and written as they arrive,
+    so memory stays constant regardless of catalog size
+    ---
+    tags:
+      - Books
+    produces:
+      - application/x-ndjson
+      - text/csv
+    parameters:
+      - name: format
+        in: query
+        type: string
+        default: ndjson
+        enum: ['ndjson', 'csv']
+        description: Output format (one JSON object per line, or CSV with header)
+      - name: status
+        in: query
+        type: string
+        default: active
+        enum: ['active', 'inactive', 'all']
+        description: Filter books by is_active (active, inactive or all)
+      - name: fields
+        in: query
+        type: string
+        description: Comma separated fields to export (default all), ex. "ISBN,Title"
+    responses:
+      200:
+        description: Catalog stream, ordered by ISBN
+      400:
+        description: Invalid 'format', 'status' or 'fields' parameter
+    """
+    fmt = request.args.get('format', 'ndjson')
+    status_filter = request.args.get('status', 'active')
+
+    if fmt not in ('ndjson', 'csv'):
+        return jsonify({"error": "Invalid 'format' parameter. Use 'ndjson' or 'csv'."}), 400
+
+    try:
+        fields = parse_fields(request.args.get('fields'), BOOK_FIELDS)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid 'fields' parameter. {e}"}), 400
+
+    # Só as colunas necessárias: nada de hidratar entidades do ORM
+    columns, joins = projection(fields, BOOK_FIELDS)
+    stmt = apply_joins(select(*columns).select_from(Book), joins, BOOK_JOINS)
+
+    if status_filter == 'active':
+        stmt = stmt.where(Book.is_active == True)
+    elif status_filter == 'inactive':
+        stmt = stmt.where(Book.is_active == False)
+    elif status_filter != 'all':
+        return jsonify({"error": "Invalid 'status' parameter. Use 'active', 'inactive', or 'all'."}), 400
+
+    # 'yield_per' liga o cursor do lado do servidor (stream_results) e busca em blocos
+    stmt = stmt.order_by(Book.ISBN).execution_options(yield_per=EXPORT_CHUNK_SIZE)
+
+    def rows():
+        for row in db.session.execute(stmt):
+            yield render(row, fields, BOOK_FIELDS)
+
+    def generate_ndjson():
+        for book_data in rows():
+            yield json.dumps(book_data, ensure_ascii=False) + '\n'
+
+    def generate_csv():
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=fields)
+        writer.writeheader()
+        for i, book_data in enumerate(rows(), start=1):
+            writer.writerow(book_data)
+            # Enviamos em blocos para não fazer um write por linha
+            if i % EXPORT_CHUNK_SIZE == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+
+    if fmt == 'csv':
+        body, mimetype = generate_csv(), 'text/csv'
+    else:
+        body, mimetype = generate_ndjson(), 'application/x-ndjson'
+
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename=books.{fmt}'}
+    )
+
+@bp.route('/lookup', methods=['POST'])
+def lookup_books():
+    """
+    Endpoint for getting many books by ISBN in one request
+    The ISBNs are resolved with IN queries (in chunks), instead of one request per book
+    ---
+    tags:
+        - Books
+    parameters:
+        - name: fields
+          in: query
+          type: string
+          description: Comma separated fields to return (default all), ex. "Title". ISBN is always returned
+        - name: body
+          in: body
+          required: true
+          schema:
+            type: object
+            required:
+                - ISBNs
+            properties:
+                ISBNs:
+                    type: array
+                    description: Up to 5000 ISBNs. Can contain '-'
+                    items:
+                        type: string
+                    example: ["9788599296578", "978-85-359-0277-1"]
+    responses:
+        200:
+            description: Lookup done
+            schema:
+                type: object
+                properties:
+                    found:
+                        type: array
+                        description: Books found, in the order requested
+                        items:
+                            type: object
+                    missing:
+                        type: array
+                        description: ISBNs not registered
+                        items:
+                            type: string
+        400:
+            description: Invalid body or 'fields' parameter
+        500:
+            description: Internal server error
+    """
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({'message': 'No data provided'}), 400
+
+    isbns = data.get('ISBNs')
+    if not isinstance(isbns, list) or not all(isinstance(isbn, str) for isbn in isbns):
+        return jsonify({"error": "ISBNs must be a list of strings"}), 400
+    if len(isbns) > LOOKUP_MAX_ISBNS:
+        return jsonify({"error": f"At most {LOOKUP_MAX_ISBNS} ISBNs per request"}), 400
+
+    try:
+        fields = parse_fields(request.args.get('fields'), BOOK_FIELDS)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid 'fields' parameter. {e}"}), 400
+
+    # O ISBN sempre volta, para o cliente casar a resposta com o pedido
+    if 'ISBN' not in fields:
+        fields.insert(0, 'ISBN')
+
+    try:
+        # Remove '-' e repetições, mantendo a ordem pedida
+        wanted = list(dict.fromkeys(isbn.replace('-', '').strip() for isbn in isbns))
+
+        columns, joins = projection(fields, BOOK_FIELDS)
+        query = apply_joins(db.session.query(*columns).select_from(Book), joins, BOOK_JOINS)
+
+        found = {}
+        for start in range(0, len(wanted), LOOKUP_CHUNK_SIZE):
+            chunk = wanted[start:start + LOOKUP_CHUNK_SIZE]
+            for row in query.filter(Book.ISBN.in_(chunk)):
+                found[row.ISBN] = render(row, fields, BOOK_FIELDS)
+
+        return jsonify({
+            'found': [found[isbn] for isbn in wanted if isbn in found],
+            'missing': [isbn for isbn in wanted if isbn not in found]
+        }), 200
+
+    except Exception as e:
+        logging.error(f"Failed to lookup books: {e}")
+        return jsonify({"error": "Failed to lookup books"}), 500
+
+@bp.route('/suggest', methods=['GET'])
+def suggest_books():
+    """
+    Endpoint for typeahead suggestions of book titles and author names
+    Answered from an in-memory prefix index (accents and case are ignored)
+    ---
+    tags:
+      - Books
+    parameters:
+      - name: q
+        in: query
+        type: string
+        required: true
+        description: Beginning of a title or of an author's name
+      - name: limit
+        in: query
+        type: integer
+        default: 10
+        description: Max number of suggestions (max 50)
+    responses:
+      200:
+        description: Suggestions recovered successfully
+        schema:
+          type: object
+          properties:
+            suggestions:
+              type: array
+              items:
+                type: object
+                properties:
+                  type:
+                    type: string
+                    example: "book"
+                  ISBN:
+                    type: string
+                    example: "9788599296578"
+                  Title:
+                    type: string
+                    example: "Lord of the Rings: The Fellowship of the Ring"
+      400:
+        description: Invalid 'limit' parameter
+      500:
+        description: Internal server error
+    """
+    try:
+        try:
+            limit = parse_limit(request.args.get('limit'), default=10, maximum=50)
+        except ValueError:
+            return jsonify({"error": "Invalid 'limit' parameter. Use a positive integer."}), 400
+
+        prefix = normalize(request.args.get('q', ''))
+        if not prefix:
+            return jsonify({'suggestions': []}), 200
+
+        ensure_suggestions_loaded()
+
+        output = []
+        for kind, ident, label in suggestions.search(prefix, limit):
+            if kind == 'book':
+                output.append({'type': 'book', 'ISBN': ident, 'Title': label})
+            else:
+                output.append({'type': 'author', 'idAuthor': ident, 'Name': label})
+
+        return jsonify({'suggestions': output}), 200
+
+    except Exception as e:
+        logging.error(f"Failed to get suggestions: {e}")
+        return jsonify({"error": "Failed to get suggestions"}), 500
+
 @bp.route('/<string:isbn>', methods=['GET'])
 def get_book(isbn):
     """
@@ -292,7 +853,7 @@ def get_book(isbn):
           description: Unique Book ISBN that needs to be found
     responses:
         200:
-            description: Book successfully found
+            description: Book successfully found, with available / borrowed / in repair copies per branch
         404:
             description: Book not found
         500:
@@ -317,9 +878,10 @@ def get_book(isbn):
             'Publisher': publisher.Name,
             'Edition': book.Edition,
             'Language': book.Language,
-            'Collection': collection.Name,
+            'Collection': collection.Name if collection else None,
             'AgeRange': book.AgeRange,
-            'Review': book.Review
+            'Review': book.Review,
+            'Availability': get_availability([book.ISBN]).get(book.ISBN, [])
         }
         return jsonify(book_data), 200
 
@@ -395,7 +957,7 @@ def update_book(isbn):
         if not result:
             return jsonify({"error": "Book not found"}), 404
 
-        book, author, publisher = result
+        book = result[0]
 
         # Atualizar o livro
         book.Title = data.get('Title', book.Title)
@@ -407,6 +969,7 @@ def update_book(isbn):
         book.idPublisher = data.get('idPublisher', book.idPublisher)
 
         db.session.commit()
+        index_book(book)
         return jsonify({'message': 'Book successfully updated'}), 200
     except Exception as e:
         db.session.rollback()
@@ -439,9 +1002,10 @@ def delete_book(isbn):
         if not result:
             return jsonify({"error": "Book not found"}), 404
 
-        book, author, publisher = result
+        book = result[0]
         book.is_active = False
         db.session.commit()
+        index_book(book)
         return '', 204
     except Exception as e:
         logging.error(f"Failed to delete book: {e}")
@@ -454,10 +1018,57 @@ def get_book_by_isbn(isbn):
         Publisher,
         Collection
     ).join(
-        Author,
-        Publisher
+        Author, Author.idAuthor == Book.idAuthor
+    ).join(
+        Publisher, Publisher.idPublisher == Book.idPublisher
     ).outerjoin(
-        Collection
+        Collection, Collection.idCollection == Book.Collection
     ).filter(
         Book.ISBN == isbn,
-        ).first()  # .first() pega apenas um
\ No newline at end of file
+        ).first()  # .first() pega apenas um
+
+def get_facets(query):
+    """
+    Count the books of a filtered catalog query by Language, Publisher, Collection and AgeRange
+    One grouped pass over the filtered rows, then the names of the few ids found
+    :param query: <Query> catalog query with the filters already applied
+    :return: <dict> facet name -> list of counts, most frequent first
+    """
+    grouped = query.with_entities(
+        Book.Language,
+        Book.idPublisher,
+        Book.Collection,
+        Book.AgeRange,
+        func.count()
+    ).group_by(
+        Book.Language,
+        Book.idPublisher,
+        Book.Collection,
+        Book.AgeRange
+    ).order_by(None).all()
+
+    counts = {'Language': {}, 'Publisher': {}, 'Collection': {}, 'AgeRange': {}}
+    for id_language, id_publisher, id_collection, age_range, total in grouped:
+        for facet, key in (('Language', id_language), ('Publisher', id_publisher),
+                           ('Collection', id_collection), ('AgeRange', age_range)):
+            counts[facet][key] = counts[facet].get(key, 0) + total
+
+    # Nomes das entradas encontradas (tabelas pequenas, busca por chave primária)
+    names = {
+        'Language': names_by_id(Language.idLanguage, Language.Name, counts['Language']),
+        'Publisher': names_by_id(Publisher.idPublisher, Publisher.Name, counts['Publisher']),
+        'Collection': names_by_id(Collection.idCollection, Collection.Name, counts['Collection']),
+    }
+
+    facets = {}
+    for facet, facet_counts in counts.items():
+        items = sorted(facet_counts.items(), key=lambda item: -item[1])
+        if facet == 'AgeRange':
+            facets[facet] = [{'value': key, 'count': total} for key, total in items]
+        else:
+            facets[facet] = [
+                {'id': key, 'Name': names[facet].get(key), 'count': total}
+                for key, total in items
+            ]
+
+    return facets
@@ -1,13 +1,21 @@
 import logging
 
 from flask import Blueprint, request, jsonify
+from sqlalchemy import func
 
 from .. import db
-from ..models import Branch, Address
+from ..availability import STATUS_COLUMNS
+from ..cache import ResponseCache, cached_response
+from ..fields import names_by_id
+from ..models import Book, Branch, Address, Collection, Language, PhysicalBook
 
 # 'Blueprint' é como organizamos um grupo de rotas
 bp = Blueprint('branchs', __name__, url_prefix='/api/branchs')
 
+# Cache do inventário das filiais. É limpo a cada commit que altere exemplares ou livros
+# (ex.: mudança de Status); o TTL curto limita dados antigos vindos de outros processos.
+inventory_cache = ResponseCache([PhysicalBook, Book, Branch, Collection, Language], ttl=60)
+
 
 @bp.route('/', methods=['POST'])
 def create_branch():
@@ -259,6 +267,117 @@ def get_branch(branch_id):
         return jsonify({"error": f"Failed to get branch: {e}"}), 500
 
 
+@bp.route('/<int:branch_id>/inventory', methods=['GET'])
+@cached_response(inventory_cache)
+def get_branch_inventory(branch_id):
+    """
+    Endpoint for the inventory snapshot of a branch
+    Copies counted by Status, by Language and by Collection, computed in one grouped query.
+    Responses are cached for a short time and carry a strong ETag (send If-None-Match to get a 304)
+    ---
+    tags:
+        - Branches
+    parameters:
+        - name: branch_id
+          in: path
+          type: integer
+          required: true
+          description: Branch ID
+    responses:
+        200:
+            description: Inventory recovered successfully
+            schema:
+                type: object
+                properties:
+                    idBranch:
+                        type: integer
+                    BranchName:
+                        type: string
+                    Total:
+                        type: integer
+                        example: 1200
+                    Status:
+                        type: object
+                        example: {"AVAILABLE": 950, "BORROWED": 200, "IN REPAIR": 40, "LOST": 10}
+                    Language:
+                        type: array
+                        items:
+                            type: object
+                            properties:
+                                idLanguage:
+                                    type: integer
+                                Name:
+                                    type: string
+                                Total:
+                                    type: integer
+                                Status:
+                                    type: object
+                    Collection:
+                        type: array
+                        description: Same format as Language; books without collection have idCollection null
+                        items:
+                            type: object
+        404:
+            description: Branch not found
+        500:
+            description: Internal server error
+    """
+    try:
+        branch = db.session.get(Branch, branch_id)
+        if not branch:
+            return jsonify({"error": "Branch not found"}), 404
+
+        # 1. Uma única agregação: exemplares da filial por (Status, Language, Collection)
+        grouped = db.session.query(
+            PhysicalBook.Status,
+            Book.Language,
+            Book.Collection,
+            func.count()
+        ).join(
+            Book, PhysicalBook.ISBN == Book.ISBN
+        ).filter(
+            PhysicalBook.idBranch == branch_id
+        ).group_by(
+            PhysicalBook.Status,
+            Book.Language,
+            Book.Collection
+        ).all()
+
+        # 2. Somamos os grupos em cada dimensão
+        statuses = {status: 0 for status in STATUS_COLUMNS}
+        languages = {}
+        collections = {}
+        for status, id_language, id_collection, total in grouped:
+            statuses[status] += total
+            for counts, key in ((languages, id_language), (collections, id_collection)):
+                entry = counts.setdefault(key, {status: 0 for status in STATUS_COLUMNS})
+                entry[status] += total
+
+        # 3. Nomes das entradas encontradas (tabelas pequenas, busca por chave primária)
+        language_names = names_by_id(Language.idLanguage, Language.Name, languages)
+        collection_names = names_by_id(Collection.idCollection, Collection.Name, collections)
+
+        def breakdown(counts, id_name, names):
+            items = [
+                {id_name: key, 'Name': names.get(key), 'Total': sum(by_status.values()), 'Status': by_status}
+                for key, by_status in counts.items()
+            ]
+            return sorted(items, key=lambda item: -item['Total'])
+
+        return jsonify({
+            'idBranch': branch.idBranch,
+            'BranchName': branch.BranchName,
+            'Total': sum(statuses.values()),
+            'Status': statuses,
+            'Language': breakdown(languages, 'idLanguage', language_names),
+            'Collection': breakdown(collections, 'idCollection', collection_names)
+        }), 200
+
+    except Exception as e:
+        logging.error(f"Failed to get branch inventory: {e}")
+        return jsonify({"error": f"Failed to get branch inventory: {e}"}), 500
+
+
 @bp.route('/<int:branch_id>', methods=['PUT', 'PATCH'])
 def update_branch(branch_id):
     """
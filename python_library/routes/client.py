@@ -3,6 +3,7 @@ import logging
 from flask import Blueprint, request, jsonify
 
 from .. import db
+from ..fines import client_fines
 from ..models import Address, Client, ClientFP, ClientJP, BookReview, Book
 
 # 'Blueprint' é como organizamos um grupo de rotas
@@ -433,6 +434,77 @@ def get_client(client_id):
         return jsonify({"error": f"Failed to get client: {e}"}), 500
 
 
+@bp.route('/<int:client_id>/fines', methods=['GET'])
+def get_client_fines(client_id):
+    """
+    Endpoint for the fines of a client
+    Fines of the client's late loans (open or returned late), computed on the fly up to today
+    Read only: LoanFine is written by 'flask calculate-fines'
+    ---
+    tags:
+      - Clients
+    parameters:
+      - name: client_id
+        in: path
+        type: integer
+        required: true
+        description: Unique Client ID
+    responses:
+      200:
+        description: Fines successfully calculated
+        schema:
+          type: object
+          properties:
+            idClient:
+              type: integer
+            Total:
+              type: number
+              example: 12.5
+            fines:
+              type: array
+              items:
+                type: object
+                properties:
+                  idBookLoan:
+                    type: integer
+                  DaysLate:
+                    type: integer
+                  Amount:
+                    type: number
+                  CalculatedDate:
+                    type: string
+      404:
+        description: Client not found
+      500:
+        description: Erro interno do servidor
+    """
+    try:
+        if not db.session.get(Client, client_id):
+            return jsonify({"error": "Client not found"}), 404
+
+        fines = client_fines(client_id)
+
+        output = [
+            {
+                'idBookLoan': fine['idBookLoan'],
+                'DaysLate': fine['DaysLate'],
+                'Amount': float(fine['Amount']),
+                'CalculatedDate': fine['CalculatedDate'].isoformat()
+            }
+            for fine in fines
+        ]
+
+        return jsonify({
+            'idClient': client_id,
+            'Total': float(sum(fine['Amount'] for fine in fines)),
+            'fines': output
+        }), 200
+
+    except Exception as e:
+        logging.error(f"Failed to get client fines: {e}")
+        return jsonify({"error": f"Failed to get client fines: {e}"}), 500
+
+
 @bp.route('/<int:client_id>', methods=['PUT', 'PATCH'])
 def update_client(client_id):
     """
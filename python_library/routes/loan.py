@@ -1,14 +1,33 @@
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 import logging
 
 from flask import Blueprint, jsonify, request
+from sqlalchemy import exists, func, insert, select, tuple_, update
 
-from .. import db
-from ..models import Book, BookLoan, PhysicalBook, Client, Branch, ClientJP, ClientFP
+from .. import availability, db
+from ..fines import close_fines
+from ..overdue import clear_overdue, has_overdue_loans
+from ..models import Book, BookLoan, PhysicalBook, Client, Branch, ClientJP, ClientFP, Reserve
+from ..pagination import parse_limit, paginate
 
 # 'Blueprint' é como organizamos um grupo de rotas
 bp = Blueprint('loans', __name__, url_prefix='/api/loans')
 
+# Valores aceitos no filtro 'status' da listagem
+LOAN_STATUSES = ('ACTIVE', 'RETURNED', 'LOST')
+
+# Máximo de exemplares por retirada em lote
+CHECKOUT_MAX_ITEMS = 50
+
+# Máximo de ids (empréstimos + exemplares) por devolução em lote e ids por consulta (lista do IN)
+RETURN_MAX_IDS = 5000
+RETURN_CHUNK_SIZE = 1000
+
+# Renovação: dias padrão, máximo de dias e máximo de empréstimos por requisição
+RENEW_DEFAULT_DAYS = 14
+RENEW_MAX_DAYS = 60
+RENEW_MAX_IDS = 1000
+
 @bp.route('/', methods=['POST'], strict_slashes=False)
 def create_loan():
     """
@@ -44,7 +63,7 @@ def create_loan():
         404:
             description: Book or Client not found
         409:
-            description: Book unavailable
+            description: Book unavailable (already borrowed, also when another desk took it at the same time) or client with overdue loans
     """
     data = request.get_json()
     if not data:
@@ -59,13 +78,28 @@ def create_loan():
         return jsonify({"error": "idClient and idPhysicalBook are required."}), 400
 
     try:
-        # Verifica se o livro está disponível
+        if has_overdue_loans(id_client):
+            return jsonify({"error": "Client has overdue loans."}), 409
+
+        # Reserva o exemplar de forma atômica: o UPDATE só altera a linha se ela ainda estiver AVAILABLE.
+        # Com duas retiradas simultâneas do mesmo exemplar, a segunda espera a trava da linha
+        # e não altera nada (rowcount 0), então o exemplar nunca é emprestado duas vezes.
+        result = db.session.execute(
+            update(PhysicalBook)
+            .where(PhysicalBook.idPhysicalBook == id_physical_book, PhysicalBook.Status == 'AVAILABLE')
+            .values(Status='BORROWED')
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount != 1:
+            db.session.rollback()
+            if not db.session.get(PhysicalBook, id_physical_book):
+                return jsonify({"error": "Book not found"}), 404
+            return jsonify({"error": "Book not available to loan."}), 409
 
-        physical_book = db.session.get(PhysicalBook, id_physical_book)
-        if not physical_book:
-            return jsonify({"error": "Book not found"}), 404
-        if physical_book.Status != 'AVAILABLE':
-            return jsonify({"error":"Book not available to loan."}), 409
+        physical_book = db.session.execute(
+            select(PhysicalBook.ISBN, PhysicalBook.idBranch)
+            .where(PhysicalBook.idPhysicalBook == id_physical_book)
+        ).first()
 
         # Calcula data de due_date
         due_date = datetime.now().date() + timedelta(days=days_solicited)
@@ -78,8 +112,7 @@ def create_loan():
         )
         db.session.add(new_loan)
 
-        physical_book.Status = 'BORROWED'
-        db.session.add(physical_book)
+        availability.move(physical_book.ISBN, physical_book.idBranch, 'AVAILABLE', 'BORROWED')
 
         db.session.commit()
         return jsonify({"message": "Loan created successfully.", "DueDate": due_date}), 201
@@ -88,6 +121,622 @@ def create_loan():
         logging.error(f"Error in creating loan: {e}")
         return jsonify({"message": f"Error in creating loan: {e}"}), 500
 
+@bp.route('/', methods=['GET'], strict_slashes=False)
+def get_loans():
+    """
+    Endpoint for listing loans, newest first
+    Filters can be combined; pages are fetched with a cursor
+    ---
+    tags:
+        - Loans
+    parameters:
+      - name: client_id
+        in: query
+        type: integer
+        description: Only loans of this client
+      - name: physical_book_id
+        in: query
+        type: integer
+        description: Only loans of this copy
+      - name: branch_id
+        in: query
+        type: integer
+        description: Only loans of copies of this branch
+      - name: status
+        in: query
+        type: string
+        description: Only loans with these Status (comma separated), ex. "ACTIVE,LOST"
+      - name: borrowed_from
+        in: query
+        type: string
+        format: date
+        description: Only loans borrowed on or after this date (YYYY-MM-DD)
+      - name: borrowed_to
+        in: query
+        type: string
+        format: date
+        description: Only loans borrowed on or before this date (YYYY-MM-DD)
+      - name: limit
+        in: query
+        type: integer
+        default: 50
+        description: Page size (max 500)
+      - name: cursor
+        in: query
+        type: string
+        description: Opaque cursor returned as 'next_cursor' by the previous page
+    responses:
+      200:
+        description: Loans list recovered successfully
+        schema:
+          type: object
+          properties:
+            loans:
+              type: array
+              items:
+                type: object
+            next_cursor:
+              type: string
+              description: Cursor of the next page (null on the last page)
+      400:
+        description: Invalid filter, 'limit' or 'cursor' parameter
+      500:
+        description: Internal server error
+    """
+    try:
+        try:
+            limit = parse_limit(request.args.get('limit'))
+        except ValueError:
+            return jsonify({"error": "Invalid 'limit' parameter. Use a positive integer."}), 400
+
+        filters = {}
+        for name in ('client_id', 'physical_book_id', 'branch_id'):
+            filters[name] = request.args.get(name, type=int)
+            if request.args.get(name) and filters[name] is None:
+                return jsonify({"error": f"Invalid '{name}' parameter. Use an integer."}), 400
+
+        statuses = [s.strip().upper() for s in request.args.get('status', '').split(',') if s.strip()]
+        if any(s not in LOAN_STATUSES for s in statuses):
+            return jsonify({"error": f"Invalid 'status' parameter. Use: {', '.join(LOAN_STATUSES)}"}), 400
+
+        try:
+            borrowed_from = request.args.get('borrowed_from')
+            borrowed_from = date.fromisoformat(borrowed_from) if borrowed_from else None
+            borrowed_to = request.args.get('borrowed_to')
+            borrowed_to = date.fromisoformat(borrowed_to) if borrowed_to else None
+        except ValueError:
+            return jsonify({"error": "Invalid 'borrowed_from' or 'borrowed_to' parameter. Use YYYY-MM-DD."}), 400
+
+        query = db.session.query(
+            BookLoan.idBookLoan,
+            BookLoan.idPhysicalBook,
+            BookLoan.idClient,
+            BookLoan.BorrowedDate,
+            BookLoan.DueDate,
+            BookLoan.ReturnDate,
+            BookLoan.Status,
+            PhysicalBook.ISBN,
+            PhysicalBook.idBranch,
+            Book.Title
+        ).join(
+            PhysicalBook, BookLoan.idPhysicalBook == PhysicalBook.idPhysicalBook
+        ).join(
+            Book, PhysicalBook.ISBN == Book.ISBN
+        )
+
+        # Filtros cobertos pelos índices (idClient, Status) e (idPhysicalBook, BorrowedDate)
+        if filters['client_id'] is not None:
+            query = query.filter(BookLoan.idClient == filters['client_id'])
+        if filters['physical_book_id'] is not None:
+            query = query.filter(BookLoan.idPhysicalBook == filters['physical_book_id'])
+        if filters['branch_id'] is not None:
+            query = query.filter(PhysicalBook.idBranch == filters['branch_id'])
+        if statuses:
+            query = query.filter(BookLoan.Status.in_(statuses))
+        if borrowed_from:
+            query = query.filter(BookLoan.BorrowedDate >= borrowed_from)
+        if borrowed_to:
+            query = query.filter(BookLoan.BorrowedDate < borrowed_to + timedelta(days=1))
+
+        # Mais recentes primeiro, pela chave primária (crescente com BorrowedDate).
+        # No InnoDB ela fecha todo índice secundário: só client_id com um único status lê
+        # (idClient, Status) já nessa ordem. client_id sozinho (ou com vários status) e
+        # physical_book_id ordenam em memória (filesort), mas só os empréstimos daquele cliente/exemplar.
+        query = query.order_by(BookLoan.idBookLoan.desc())
+
+        try:
+            results, next_cursor = paginate(
+                query,
+                [BookLoan.idBookLoan],
+                limit,
+                cursor=request.args.get('cursor'),
+                descending=True,
+                key=lambda row: (row.idBookLoan,)
+            )
+        except ValueError:
+            return jsonify({"error": "Invalid 'cursor' parameter."}), 400
+
+        output = [
+            {
+                'idBookLoan': row.idBookLoan,
+                'idPhysicalBook': row.idPhysicalBook,
+                'idClient': row.idClient,
+                'ISBN': row.ISBN,
+                'Title': row.Title,
+                'idBranch': row.idBranch,
+                'BorrowedDate': row.BorrowedDate.isoformat() if row.BorrowedDate else None,
+                'DueDate': row.DueDate.isoformat() if row.DueDate else None,
+                'ReturnDate': row.ReturnDate.isoformat() if row.ReturnDate else None,
+                'Status': row.Status
+            }
+            for row in results
+        ]
+
+        return jsonify({'loans': output, 'next_cursor': next_cursor}), 200
+    except Exception as e:
+        logging.error(f"Failed to get loans: {e}")
+        return jsonify({"message": f"Failed to get loans: {e}"}), 500
+
+@bp.route('/batch', methods=['POST'])
+def create_loans_batch():
+    """
+    Endpoint for lending many physical books to one client at once
+    All copies are locked and validated with one query and every loan is inserted in one transaction.
+    mode 'all' (default): nothing is lent if any copy can't be; mode 'partial': lend what is possible
+    ---
+    tags:
+        - Loans
+    parameters:
+        - name: body
+          in: body
+          required: true
+          schema:
+            type: object
+            required:
+                - idClient
+                - idPhysicalBooks
+            properties:
+                idClient:
+                    type: integer
+                    example: 2
+                idPhysicalBooks:
+                    type: array
+                    items:
+                        type: integer
+                    example: [1, 5, 9]
+                    description: Physical Book ids (max 50)
+                BorrowTimeSolicited:
+                    type: integer
+                    example: 14
+                    description: (Optional) Days Solicited for the loans
+                mode:
+                    type: string
+                    enum: ['all', 'partial']
+                    default: all
+    responses:
+        201:
+            description: Loans created (with mode 'partial', maybe not for every copy)
+            schema:
+                type: object
+                properties:
+                    idClient:
+                        type: integer
+                    DueDate:
+                        type: string
+                    borrowed:
+                        type: integer
+                    results:
+                        type: array
+                        items:
+                            type: object
+                            properties:
+                                idPhysicalBook:
+                                    type: integer
+                                outcome:
+                                    type: string
+                                    enum: ['borrowed', 'not_found', 'not_available', 'available']
+                                    description: "'available' only on a 409: the copy could be lent, but nothing was"
+                                idBookLoan:
+                                    type: integer
+        400:
+            description: Invalid data
+        404:
+            description: Client not found
+        409:
+            description: Copies not available or client with overdue loans (nothing was lent)
+        500:
+            description: Internal server error
+    """
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({'message': 'No data provided'}), 400
+
+    id_client = data.get('idClient')
+    ids = data.get('idPhysicalBooks')
+    days_solicited = data.get('BorrowTimeSolicited', 14) # Se não for informado, o padrão é 14
+    mode = data.get('mode', 'all')
+
+    if not id_client or not ids or not isinstance(ids, list) or not all(isinstance(i, int) for i in ids):
+        return jsonify({"error": "idClient and a list of idPhysicalBooks are required."}), 400
+    if mode not in ('all', 'partial'):
+        return jsonify({"error": "Invalid 'mode'. Use 'all' or 'partial'."}), 400
+    ids = list(dict.fromkeys(ids))
+    if len(ids) > CHECKOUT_MAX_ITEMS:
+        return jsonify({"error": f"At most {CHECKOUT_MAX_ITEMS} copies per checkout."}), 400
+
+    try:
+        if not db.session.get(Client, id_client):
+            return jsonify({"error": "Client not found"}), 404
+        if has_overdue_loans(id_client):
+            return jsonify({"error": "Client has overdue loans."}), 409
+
+        # 1. Lê e trava (FOR UPDATE) todos os exemplares numa única consulta
+        copies = {row.idPhysicalBook: row for row in db.session.execute(
+            select(PhysicalBook.idPhysicalBook, PhysicalBook.ISBN, PhysicalBook.idBranch, PhysicalBook.Status)
+            .where(PhysicalBook.idPhysicalBook.in_(ids))
+            .with_for_update()
+        )}
+
+        results = []
+        lent = []
+        for ident in ids:
+            copy = copies.get(ident)
+            if copy is None:
+                results.append({'idPhysicalBook': ident, 'outcome': 'not_found'})
+            elif copy.Status != 'AVAILABLE':
+                results.append({'idPhysicalBook': ident, 'outcome': 'not_available', 'Status': copy.Status})
+            else:
+                results.append({'idPhysicalBook': ident, 'outcome': 'available'})
+                lent.append(ident)
+
+        if not lent or (mode == 'all' and len(lent) < len(ids)):
+            db.session.rollback()
+            return jsonify({"error": "Books not available to loan. Nothing was lent.", 'results': results}), 409
+
+        # 2. Empréstimos e exemplares gravados em lote
+        due_date = datetime.now().date() + timedelta(days=days_solicited)
+        db.session.execute(
+            update(PhysicalBook)
+            .where(PhysicalBook.idPhysicalBook.in_(lent), PhysicalBook.Status == 'AVAILABLE')
+            .values(Status='BORROWED')
+            .execution_options(synchronize_session=False)
+        )
+        db.session.execute(insert(BookLoan), [
+            {
+                'idPhysicalBook': ident,
+                'idClient': id_client,
+                'DueDate': due_date,
+                'BorrowTimeSolicited': days_solicited
+            }
+            for ident in lent
+        ])
+
+        changes = availability.AvailabilityChanges()
+        for ident in lent:
+            changes.move(copies[ident].ISBN, copies[ident].idBranch, 'AVAILABLE', 'BORROWED')
+        changes.apply()
+
+        # 3. Ids dos empréstimos criados (os exemplares estão travados: só há um ACTIVE para cada)
+        loan_ids = dict(db.session.execute(
+            select(BookLoan.idPhysicalBook, BookLoan.idBookLoan)
+            .where(BookLoan.idPhysicalBook.in_(lent), BookLoan.Status == 'ACTIVE', BookLoan.idClient == id_client)
+        ).all())
+        for result in results:
+            if result['outcome'] == 'available':
+                result['outcome'] = 'borrowed'
+                result['idBookLoan'] = loan_ids.get(result['idPhysicalBook'])
+
+        db.session.commit()
+        return jsonify({
+            'idClient': id_client,
+            'DueDate': due_date.isoformat(),
+            'borrowed': len(lent),
+            'results': results
+        }), 201
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Error in creating loans: {e}")
+        return jsonify({"message": f"Error in creating loans: {e}"}), 500
+
+@bp.route('/return', methods=['POST'])
+def return_loans_batch():
+    """
+    Endpoint for returning many loans at once (ex.: book-drop station)
+    Loans can be given by loan id and/or by copy id (its ACTIVE loan is returned).
+    Every loan and copy is updated with set-based UPDATEs in one transaction.
+    Also lists the returned copies that have pending reserves for their book in their branch
+    ---
+    tags:
+        - Loans
+    parameters:
+        - name: body
+          in: body
+          required: true
+          schema:
+            type: object
+            properties:
+                idBookLoans:
+                    type: array
+                    items:
+                        type: integer
+                    example: [10, 11]
+                idPhysicalBooks:
+                    type: array
+                    items:
+                        type: integer
+                    example: [1, 5]
+    responses:
+        200:
+            description: Loans returned
+            schema:
+                type: object
+                properties:
+                    returned:
+                        type: integer
+                    results:
+                        type: array
+                        items:
+                            type: object
+                            properties:
+                                idBookLoan:
+                                    type: integer
+                                idPhysicalBook:
+                                    type: integer
+                                outcome:
+                                    type: string
+                                    enum: ['returned', 'not_active']
+                    reserved:
+                        type: array
+                        description: Returned copies with pending reserves (put them aside)
+                        items:
+                            type: object
+                            properties:
+                                idPhysicalBook:
+                                    type: integer
+                                ISBN:
+                                    type: string
+                                idBranch:
+                                    type: integer
+                                PendingReserves:
+                                    type: integer
+                                FirstReserveDate:
+                                    type: string
+        400:
+            description: Invalid data
+        500:
+            description: Internal server error
+    """
+    data = request.get_json(silent=True) or {}
+    loan_ids = data.get('idBookLoans') or []
+    copy_ids = data.get('idPhysicalBooks') or []
+
+    for ids in (loan_ids, copy_ids):
+        if not isinstance(ids, list) or not all(isinstance(i, int) for i in ids):
+            return jsonify({"error": "idBookLoans and idPhysicalBooks must be lists of integers."}), 400
+    if not loan_ids and not copy_ids:
+        return jsonify({"error": "Send idBookLoans and/or idPhysicalBooks."}), 400
+    loan_ids = list(dict.fromkeys(loan_ids))
+    copy_ids = list(dict.fromkeys(copy_ids))
+    if len(loan_ids) + len(copy_ids) > RETURN_MAX_IDS:
+        return jsonify({"error": f"At most {RETURN_MAX_IDS} ids per request."}), 400
+
+    try:
+        # 1. Lê e trava (FOR UPDATE) os empréstimos ativos pedidos e os seus exemplares
+        loans = {}
+        for ids, column in ((loan_ids, BookLoan.idBookLoan), (copy_ids, BookLoan.idPhysicalBook)):
+            for start in range(0, len(ids), RETURN_CHUNK_SIZE):
+                loans.update((row.idBookLoan, row) for row in db.session.execute(
+                    select(BookLoan.idBookLoan, BookLoan.idPhysicalBook, PhysicalBook.ISBN,
+                           PhysicalBook.idBranch, PhysicalBook.Status)
+                    .join(PhysicalBook, BookLoan.idPhysicalBook == PhysicalBook.idPhysicalBook)
+                    .where(column.in_(ids[start:start + RETURN_CHUNK_SIZE]), BookLoan.Status == 'ACTIVE')
+                    .with_for_update()
+                ))
+
+        returned_copies = {loan.idPhysicalBook for loan in loans.values()}
+        results = [
+            {'idBookLoan': ident, 'outcome': 'returned' if ident in loans else 'not_active'}
+            for ident in loan_ids
+        ]
+        results.extend(
+            {'idPhysicalBook': ident, 'outcome': 'returned' if ident in returned_copies else 'not_active'}
+            for ident in copy_ids
+        )
+        for result in results:
+            if 'idBookLoan' in result and result['outcome'] == 'returned':
+                result['idPhysicalBook'] = loans[result['idBookLoan']].idPhysicalBook
+
+        # 2. Fecha os empréstimos e libera os exemplares em massa
+        closed = sorted(loans)
+        freed = sorted(returned_copies)
+        for start in range(0, len(closed), RETURN_CHUNK_SIZE):
+            db.session.execute(
+                update(BookLoan)
+                .where(BookLoan.idBookLoan.in_(closed[start:start + RETURN_CHUNK_SIZE]), BookLoan.Status == 'ACTIVE')
+                .values(Status='RETURNED', ReturnDate=func.now())
+                .execution_options(synchronize_session=False)
+            )
+            clear_overdue(closed[start:start + RETURN_CHUNK_SIZE])
+        for start in range(0, len(freed), RETURN_CHUNK_SIZE):
+            db.session.execute(
+                update(PhysicalBook)
+                .where(PhysicalBook.idPhysicalBook.in_(freed[start:start + RETURN_CHUNK_SIZE]))
+                .values(Status='AVAILABLE')
+                .execution_options(synchronize_session=False)
+            )
+
+        changes = availability.AvailabilityChanges()
+        copies = {loan.idPhysicalBook: loan for loan in loans.values()}
+        for copy in copies.values():
+            changes.move(copy.ISBN, copy.idBranch, copy.Status, 'AVAILABLE')
+        changes.apply()
+
+        # 3. Reservas pendentes do mesmo livro na mesma filial, numa consulta agrupada
+        reserved = []
+        if copies:
+            pending = {
+                (isbn, id_branch): (total, first_date)
+                for isbn, id_branch, total, first_date in db.session.query(
+                    Reserve.ISBN,
+                    Reserve.idBranch,
+                    func.count(),
+                    func.min(Reserve.ReserveDate)
+                ).filter(
+                    tuple_(Reserve.ISBN, Reserve.idBranch).in_({(c.ISBN, c.idBranch) for c in copies.values()})
+                ).group_by(
+                    Reserve.ISBN,
+                    Reserve.idBranch
+                )
+            }
+            for ident in freed:
+                copy = copies[ident]
+                if (copy.ISBN, copy.idBranch) in pending:
+                    total, first_date = pending[(copy.ISBN, copy.idBranch)]
+                    reserved.append({
+                        'idPhysicalBook': ident,
+                        'ISBN': copy.ISBN,
+                        'idBranch': copy.idBranch,
+                        'PendingReserves': total,
+                        'FirstReserveDate': first_date.isoformat() if first_date else None
+                    })
+
+        db.session.commit()
+        return jsonify({'returned': len(closed), 'results': results, 'reserved': reserved}), 200
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Failed to return loans: {e}")
+        return jsonify({"message": f"Failed to return loans: {e}"}), 500
+
+@bp.route('/<int:loan_id>/renew', methods=['PUT'])
+def renew_loan(loan_id):
+    """
+    Endpoint to renew a loan
+    The new DueDate is today + days, and only applies when it extends the current one.
+    Loans that are overdue or whose book has a waiting reserve can't be renewed
+    ---
+    tags:
+        - Loans
+    parameters:
+        - name: loan_id
+          in: path
+          type: integer
+          required: true
+        - name: body
+          in: body
+          required: false
+          schema:
+            type: object
+            properties:
+                days:
+                    type: integer
+                    example: 14
+                    description: (Optional) Days from today (default 14, max 60)
+    responses:
+        200:
+            description: Loan renewed
+        400:
+            description: Invalid 'days'
+        404:
+            description: Loan not found
+        409:
+            description: Loan can't be renewed (not active, overdue, reserved or not extended)
+        500:
+            description: Internal server error
+    """
+    data = request.get_json(silent=True) or {}
+    days = data.get('days', RENEW_DEFAULT_DAYS)
+    if not isinstance(days, int) or not 1 <= days <= RENEW_MAX_DAYS:
+        return jsonify({'message': f"'days' must be between 1 and {RENEW_MAX_DAYS}"}), 400
+
+    try:
+        result = renew_loans([loan_id], days)[0]
+        db.session.commit()
+
+        if result['outcome'] == 'renewed':
+            return jsonify({'message': 'Loan renewed successfully', **result}), 200
+        if result['outcome'] == 'not_found':
+            return jsonify({'message': 'Loan not found'}), 404
+        return jsonify({'message': 'Loan cannot be renewed', **result}), 409
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Failed to renew loan: {e}")
+        return jsonify({"message": f"Failed to renew loan: {e}"}), 500
+
+@bp.route('/renew', methods=['POST'])
+def renew_loans_batch():
+    """
+    Endpoint to renew many loans at once
+    Same rules as the single renewal; every renewable loan is extended with one UPDATE
+    ---
+    tags:
+        - Loans
+    parameters:
+        - name: body
+          in: body
+          required: true
+          schema:
+            type: object
+            required:
+                - idBookLoans
+            properties:
+                idBookLoans:
+                    type: array
+                    items:
+                        type: integer
+                    example: [10, 11]
+                    description: Loan ids (max 1000)
+                days:
+                    type: integer
+                    example: 14
+                    description: (Optional) Days from today (default 14, max 60)
+    responses:
+        200:
+            description: Renewals applied
+            schema:
+                type: object
+                properties:
+                    renewed:
+                        type: integer
+                    results:
+                        type: array
+                        items:
+                            type: object
+                            properties:
+                                idBookLoan:
+                                    type: integer
+                                outcome:
+                                    type: string
+                                    enum: ['renewed', 'not_found', 'not_active', 'overdue', 'reserved', 'not_extended']
+                                DueDate:
+                                    type: string
+        400:
+            description: Invalid data
+        500:
+            description: Internal server error
+    """
+    data = request.get_json(silent=True) or {}
+    ids = data.get('idBookLoans')
+    days = data.get('days', RENEW_DEFAULT_DAYS)
+
+    if not ids or not isinstance(ids, list) or not all(isinstance(i, int) for i in ids):
+        return jsonify({'message': "'idBookLoans' must be a non-empty list of integers"}), 400
+    if not isinstance(days, int) or not 1 <= days <= RENEW_MAX_DAYS:
+        return jsonify({'message': f"'days' must be between 1 and {RENEW_MAX_DAYS}"}), 400
+    ids = list(dict.fromkeys(ids))
+    if len(ids) > RENEW_MAX_IDS:
+        return jsonify({'message': f'At most {RENEW_MAX_IDS} loans per request'}), 400
+
+    try:
+        results = renew_loans(ids, days)
+        db.session.commit()
+
+        renewed = sum(1 for result in results if result['outcome'] == 'renewed')
+        return jsonify({'renewed': renewed, 'results': results}), 200
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Failed to renew loans: {e}")
+        return jsonify({"message": f"Failed to renew loans: {e}"}), 500
+
 @bp.route('/<int:loan_id>/return', methods=['PUT'])
 def return_loan(loan_id):
     """
@@ -105,19 +754,26 @@ def return_loan(loan_id):
             description: Loan returned successfully
         404:
             description: Loan not found
+        409:
+            description: Loan is not active
         500:
             description: Internal server error
     """
     try:
-        result = get_loan_by_id(loan_id)
+        result = get_loan_by_id(loan_id, lock=True)
 
         if not result:
             return jsonify({'message': 'Loan not found'}), 404
 
-        loan, physical_book = result
+        loan, physical_book = result[:2]
+        if loan.Status != 'ACTIVE':
+            db.session.rollback()
+            return jsonify({'message': f'Loan is not active ({loan.Status})'}), 409
 
         loan.Status = 'RETURNED'
         loan.ReturnDate = db.func.now()
+        clear_overdue([loan.idBookLoan])
+        availability.move(physical_book.ISBN, physical_book.idBranch, physical_book.Status, 'AVAILABLE')
         physical_book.Status = 'AVAILABLE'
         db.session.commit()
         return jsonify({'message': 'Loan returned successfully'}), 200
@@ -143,16 +799,26 @@ def lost_loan(loan_id):
             description: Loan set successfully
         404:
             description: Loan not found
+        409:
+            description: Loan is not active
         500:
             description: Internal server error
     """
     try:
-        result = get_loan_by_id(loan_id)
+        result = get_loan_by_id(loan_id, lock=True)
         if not result:
             return jsonify({'message': 'Loan not found'}), 404
 
-        loan, physical_book = result
+        loan, physical_book = result[:2]
+        if loan.Status != 'ACTIVE':
+            db.session.rollback()
+            return jsonify({'message': f'Loan is not active ({loan.Status})'}), 409
+
+        # Fecha a multa antes da troca de Status (o recálculo diário não passa por empréstimos LOST)
+        close_fines([loan.idBookLoan])
         loan.Status = 'LOST'
+        clear_overdue([loan.idBookLoan])
+        availability.move(physical_book.ISBN, physical_book.idBranch, physical_book.Status, 'LOST')
         physical_book.Status = 'LOST'
         db.session.commit()
         return jsonify({'message': 'Loan set successfully'}), 200
@@ -161,12 +827,66 @@ def lost_loan(loan_id):
         logging.error(f"Failed to set/unset loan: {e}")
         return jsonify({'message': f"Failed to set/unset loan: {e}"}), 500
 
-def get_loan_by_id(loan_id):
+def renew_loans(loan_ids, days):
+    """
+    Extend the DueDate of ACTIVE loans to today + days (does not commit)
+    Loans are read and locked with one query that also tells, through a join with Reserve,
+    which books have waiting reserves; the renewable ones are updated with one UPDATE
+    :param loan_ids: <list> loan ids
+    :param days: <int> days from today
+    :return: <list> outcome of each loan, in the given order
+    """
+    today = datetime.now().date()
+    new_due_date = today + timedelta(days=days)
+
+    reserved = exists().where(Reserve.ISBN == PhysicalBook.ISBN)
+    loans = {row.idBookLoan: row for row in db.session.execute(
+        select(BookLoan.idBookLoan, BookLoan.Status, BookLoan.DueDate, reserved.label('Reserved'))
+        .join(PhysicalBook, BookLoan.idPhysicalBook == PhysicalBook.idPhysicalBook)
+        .where(BookLoan.idBookLoan.in_(loan_ids))
+        .with_for_update(of=BookLoan)
+    )}
+
+    results = []
+    renewable = []
+    for ident in loan_ids:
+        loan = loans.get(ident)
+        if loan is None:
+            results.append({'idBookLoan': ident, 'outcome': 'not_found'})
+            continue
+
+        result = {'idBookLoan': ident, 'DueDate': loan.DueDate.isoformat()}
+        if loan.Status != 'ACTIVE':
+            result['outcome'] = 'not_active'
+        elif loan.DueDate < today:
+            result['outcome'] = 'overdue'
+        elif loan.Reserved:
+            result['outcome'] = 'reserved'
+        elif loan.DueDate >= new_due_date:
+            result['outcome'] = 'not_extended'
+        else:
+            result['outcome'] = 'renewed'
+            result['DueDate'] = new_due_date.isoformat()
+            renewable.append(ident)
+        results.append(result)
+
+    if renewable:
+        db.session.execute(
+            update(BookLoan)
+            .where(BookLoan.idBookLoan.in_(renewable), BookLoan.Status == 'ACTIVE', BookLoan.DueDate < new_due_date)
+            .values(DueDate=new_due_date)
+            .execution_options(synchronize_session=False)
+        )
+
+    return results
+
+def get_loan_by_id(loan_id, lock=False):
     """
     Get Loan by id
     :param loan_id: <int> loan id
+    :param lock: <bool> lock the loan and its copy (FOR UPDATE) until the end of the transaction
     """
-    return db.session.query(
+    query = db.session.query(
         BookLoan,
         PhysicalBook,
         Book,
@@ -175,13 +895,23 @@ def get_loan_by_id(loan_id):
         ClientFP,
         ClientJP
     ).join(
-        PhysicalBook,
-        Book,
-        Branch,
-        Client
+        PhysicalBook, BookLoan.idPhysicalBook == PhysicalBook.idPhysicalBook
+    ).join(
+        Book, PhysicalBook.ISBN == Book.ISBN
+    ).join(
+        Branch, PhysicalBook.idBranch == Branch.idBranch
+    ).join(
+        Client, BookLoan.idClient == Client.idClient
+    ).outerjoin(
+        ClientJP, Client.idClient == ClientJP.idClient
     ).outerjoin(
-        ClientJP,
-        ClientFP
+        ClientFP, Client.idClient == ClientFP.idClient
     ).filter(
         BookLoan.idBookLoan == loan_id
-    ).first()
\ No newline at end of file
+    )
+
+    if lock:
+        # Só as linhas do empréstimo e do exemplar; populate_existing relê o Status travado
+        query = query.with_for_update(of=[BookLoan, PhysicalBook]).populate_existing()
+
+    return query.first()
\ No newline at end of file
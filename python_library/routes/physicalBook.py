@@ -1,13 +1,70 @@
 import logging
+from datetime import datetime
 
 from flask import Blueprint, request, jsonify
+from sqlalchemy import insert, select, update
 
-from .. import db
+from .. import availability, db
+from ..cache import ResponseCache
+from ..fields import Field, apply_joins, parse_fields, projection, render
 from ..models import Book, Branch, PhysicalBook, Author, Publisher, Language
+from ..pagination import parse_limit, paginate
 
 # 'Blueprint' é como organizamos um grupo de rotas
 bp = Blueprint('physicalBooks', __name__, url_prefix='/api/physicalBooks')
 
+# Limites do cadastro em lote de exemplares
+BULK_MAX_QUANTITY = 1000
+BULK_MAX_TOTAL = 10000
+
+# Metadados dos livros usados na leitura do código de barras, por ISBN.
+# Limpo a cada commit que altere livros ou autores; o TTL limita dados antigos vindos de outros processos.
+scan_book_cache = ResponseCache([Book, Author], maxsize=10000, ttl=600)
+
+# Joins possíveis da listagem de exemplares (aplicados nesta ordem, só quando necessários)
+PHYSICAL_BOOK_JOINS = {
+    'book': (Book, PhysicalBook.ISBN == Book.ISBN, False),
+    'branch': (Branch, PhysicalBook.idBranch == Branch.idBranch, False),
+    'author': (Author, Book.idAuthor == Author.idAuthor, False),
+    'publisher': (Publisher, Book.idPublisher == Publisher.idPublisher, False),
+    'language': (Language, Book.Language == Language.idLanguage, False),
+}
+
+# Valores aceitos no filtro 'copy_status'
+COPY_STATUSES = ('AVAILABLE', 'BORROWED', 'IN REPAIR', 'LOST')
+
+# Mudanças de Status permitidas pela alteração em lote (status novo -> status de origem).
+# BORROWED só muda pelos empréstimos: nunca sai nem entra por aqui.
+STATUS_TRANSITIONS = {
+    'AVAILABLE': ('IN REPAIR', 'LOST'),
+    'IN REPAIR': ('AVAILABLE', 'LOST'),
+    'LOST': ('AVAILABLE', 'IN REPAIR'),
+}
+
+# Limites da alteração em lote: ids por requisição e ids por consulta (lista do IN)
+STATUS_MAX_IDS = 10000
+STATUS_CHUNK_SIZE = 1000
+
+# Status dos exemplares que podem ser transferidos entre filiais (emprestados e perdidos não)
+TRANSFER_STATUSES = ('AVAILABLE', 'IN REPAIR')
+
+# Campos da listagem de exemplares (?fields=idPhysicalBook,Title,...)
+PHYSICAL_BOOK_FIELDS = {
+    'idPhysicalBook': Field([PhysicalBook.idPhysicalBook]),
+    'ISBN': Field([PhysicalBook.ISBN]),
+    'Title': Field([Book.Title], joins=['book']),
+    'Author': Field(
+        [Author.LName.label('AuthorLName'), Author.FName.label('AuthorFName'), Author.MName.label('AuthorMName')],
+        joins=['book', 'author'],
+        render=lambda row: f"{row.AuthorLName}, {row.AuthorFName} {row.AuthorMName or ''}".strip()
+    ),
+    'Publisher': Field([Publisher.Name.label('Publisher')], joins=['book', 'publisher']),
+    'Edition': Field([Book.Edition], joins=['book']),
+    'Language': Field([Language.Name.label('Language')], joins=['book', 'language']),
+    'BranchName': Field([Branch.BranchName], joins=['branch']),
+    'Status': Field([PhysicalBook.Status]),
+}
+
 @bp.route('/', methods=['POST'], strict_slashes=False)
 def create_book():
     """
@@ -66,6 +123,9 @@ def create_book():
         )
         db.session.add(new_physical_book)
 
+        # Novo exemplar entra como disponível na filial
+        availability.move(new_physical_book.ISBN, new_physical_book.idBranch, to_status='AVAILABLE')
+
         db.session.commit()
 
         return jsonify({'message': 'Book successfully created'}), 201
@@ -74,6 +134,116 @@ def create_book():
         logging.error(f'Failed to create book {e}')
         return jsonify({'message': f'Failed to create book: {e}'}), 400
 
+@bp.route('/bulk', methods=['POST'])
+def create_books_bulk():
+    """
+    Endpoint for creating many physical books at once (ex.: a shipment arrival)
+    All copies are inserted in one transaction; the response has the generated
+    idPhysicalBook ranges for label printing
+    ---
+    tags:
+        - PhysicalBooks
+    parameters:
+        - name: body
+          in: body
+          required: true
+          schema:
+            type: array
+            items:
+                type: object
+                required:
+                    - ISBN
+                    - idBranch
+                    - quantity
+                properties:
+                    ISBN:
+                        type: string
+                        example: "9788599296578"
+                    idBranch:
+                        type: integer
+                        example: 1
+                    quantity:
+                        type: integer
+                        example: 300
+                        description: Copies to create (max 1000 per item, 10000 per request)
+    responses:
+        201:
+            description: Physical Books successfully created
+            schema:
+                type: object
+                properties:
+                    created:
+                        type: integer
+                        example: 300
+                    items:
+                        type: array
+                        items:
+                            type: object
+                            properties:
+                                ISBN:
+                                    type: string
+                                idBranch:
+                                    type: integer
+                                quantity:
+                                    type: integer
+                                ranges:
+                                    type: array
+                                    description: "[first, last] idPhysicalBook ranges"
+                                    example: [[1201, 1500]]
+        400:
+            description: Validation error (invalid item, unknown ISBN or branch)
+        500:
+            description: Internal server error
+    """
+    data = request.get_json(silent=True)
+    if not data or not isinstance(data, list):
+        return jsonify({'message': 'Send a non-empty list of {ISBN, idBranch, quantity}'}), 400
+
+    items = []
+    for i, item in enumerate(data):
+        if not isinstance(item, dict) or not all(field in item for field in ('ISBN', 'idBranch', 'quantity')):
+            return jsonify({'message': f'Item {i}: ISBN, idBranch and quantity are required'}), 400
+        quantity = item['quantity']
+        if not isinstance(quantity, int) or not 1 <= quantity <= BULK_MAX_QUANTITY:
+            return jsonify({'message': f'Item {i}: quantity must be between 1 and {BULK_MAX_QUANTITY}'}), 400
+        items.append((str(item['ISBN']).replace('-', ''), item['idBranch'], quantity))
+
+    if sum(quantity for _, _, quantity in items) > BULK_MAX_TOTAL:
+        return jsonify({'message': f'At most {BULK_MAX_TOTAL} copies per request'}), 400
+
+    try:
+        # Validação em lote: uma consulta para os livros e uma para as filiais
+        isbns = {isbn for isbn, _, _ in items}
+        branches = {id_branch for _, id_branch, _ in items}
+        found_isbns = set(db.session.scalars(select(Book.ISBN).where(Book.ISBN.in_(isbns))))
+        found_branches = set(db.session.scalars(select(Branch.idBranch).where(Branch.idBranch.in_(branches))))
+
+        if isbns - found_isbns:
+            return jsonify({'message': 'Books not found', 'ISBNs': sorted(isbns - found_isbns)}), 400
+        if branches - found_branches:
+            return jsonify({'message': 'Branches not found', 'idBranches': sorted(branches - found_branches)}), 400
+
+        changes = availability.AvailabilityChanges()
+        output = []
+        for isbn, id_branch, quantity in items:
+            ids = insert_physical_books(isbn, id_branch, quantity)
+            changes.move(isbn, id_branch, to_status='AVAILABLE', quantity=quantity)
+            output.append({
+                'ISBN': isbn,
+                'idBranch': id_branch,
+                'quantity': quantity,
+                'ranges': id_ranges(ids)
+            })
+
+        changes.apply()
+        db.session.commit()
+
+        return jsonify({'created': sum(item['quantity'] for item in output), 'items': output}), 201
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f'Failed to create books in bulk: {e}')
+        return jsonify({'message': f'Failed to create books in bulk: {e}'}), 500
+
 @bp.route('/', methods=['GET'])
 def get_physical_books():
     """
@@ -92,32 +262,80 @@ def get_physical_books():
         default: active
         enum: ['active', 'inactive', 'all']
         description: Filter books by is_active (active, inactive or all)
+      - name: branch_id
+        in: query
+        type: integer
+        description: Only copies of this branch
+      - name: copy_status
+        in: query
+        type: string
+        description: Only copies with these Status (comma separated), ex. "AVAILABLE,IN REPAIR"
+      - name: isbn
+        in: query
+        type: string
+        description: Only copies of this book
+      - name: limit
+        in: query
+        type: integer
+        default: 50
+        description: Page size (max 500)
+      - name: cursor
+        in: query
+        type: string
+        description: Opaque cursor returned as 'next_cursor' by the previous page
+      - name: fields
+        in: query
+        type: string
+        description: Comma separated fields to return (default all), ex. "idPhysicalBook,ISBN". Only the needed columns and joins are queried
     responses:
       200:
-        description: PhysicalBooks list recovered successfully
+        description: PhysicalBooks list recovered successfully, ordered by idPhysicalBook
+        schema:
+          type: object
+          properties:
+            physical_books:
+              type: array
+              items:
+                type: object
+            next_cursor:
+              type: string
+              description: Cursor of the next page (null on the last page)
       400:
-        description: Invalid 'status' parameter
+        description: Invalid 'status', 'branch_id', 'copy_status', 'limit', 'cursor' or 'fields' parameter
     """
     try:
         status_filter = request.args.get('status', 'active')
-
-        query = db.session.query(
-            PhysicalBook,
-            Book,
-            Branch,
-            Author,
-            Publisher,
-            Language
-        ).join(
-            Book, PhysicalBook.ISBN == Book.ISBN
-        ).join(
-            Branch,PhysicalBook.idBranch == Branch.idBranch
-        ).join(
-            Author, Book.idAuthor == Author.idAuthor
-        ).join(
-            Publisher, Book.idPublisher == Publisher.idPublisher
-        ).join(
-            Language, Book.Language == Language.idLanguage
+        isbn_filter = request.args.get('isbn', '').replace('-', '').strip()
+        cursor = request.args.get('cursor')
+
+        try:
+            limit = parse_limit(request.args.get('limit'))
+        except ValueError:
+            return jsonify({"error": "Invalid 'limit' parameter. Use a positive integer."}), 400
+
+        branch_filter = request.args.get('branch_id', type=int)
+        if request.args.get('branch_id') and branch_filter is None:
+            return jsonify({"error": "Invalid 'branch_id' parameter. Use an integer."}), 400
+
+        copy_statuses = [s.strip().upper() for s in request.args.get('copy_status', '').split(',') if s.strip()]
+        if any(s not in COPY_STATUSES for s in copy_statuses):
+            return jsonify({"error": f"Invalid 'copy_status' parameter. Use: {', '.join(COPY_STATUSES)}"}), 400
+
+        try:
+            fields = parse_fields(request.args.get('fields'), PHYSICAL_BOOK_FIELDS)
+        except ValueError as e:
+            return jsonify({"error": f"Invalid 'fields' parameter. {e}"}), 400
+
+        # Só as colunas e os joins que os campos pedidos precisam
+        # (idPhysicalBook sempre, pois ordena a paginação)
+        columns, joins = projection(fields, PHYSICAL_BOOK_FIELDS, always=[PhysicalBook.idPhysicalBook])
+        if status_filter in ('active', 'inactive'):
+            joins.add('book')
+
+        query = apply_joins(
+            db.session.query(*columns).select_from(PhysicalBook),
+            joins,
+            PHYSICAL_BOOK_JOINS
         )
 
         if status_filter == 'active':
@@ -129,23 +347,30 @@ def get_physical_books():
         else:
             return jsonify({"error": "Invalid 'status' parameter. Use 'active', 'inactive', or 'all'."}), 400
 
-        results = query.all()
-
-        output = []
-        for physical_book, book, branch, author, publisher, language in results:
-            physical_book_data = {
-                'idPhysicalBook': physical_book.idPhysicalBook,
-                'ISBN': physical_book.ISBN,
-                'Title': book.Title,
-                'Author': f"{author.LName}, {author.FName} {author.MName or ''}".strip(),
-                'Publisher': publisher.Name,
-                'Edition': book.Edition,
-                'Language': language.Name,
-                'BranchName': branch.BranchName
-            }
-            output.append(physical_book_data)
-
-        return jsonify({'physical_books': output}), 200
+        # Filtros cobertos pelos índices (idBranch, Status) e (ISBN, Status)
+        if branch_filter is not None:
+            query = query.filter(PhysicalBook.idBranch == branch_filter)
+        if isbn_filter:
+            query = query.filter(PhysicalBook.ISBN == isbn_filter)
+        if copy_statuses:
+            query = query.filter(PhysicalBook.Status.in_(copy_statuses))
+
+        query = query.order_by(PhysicalBook.idPhysicalBook)
+
+        try:
+            results, next_cursor = paginate(
+                query,
+                [PhysicalBook.idPhysicalBook],
+                limit,
+                cursor=cursor,
+                key=lambda row: (row.idPhysicalBook,)
+            )
+        except ValueError:
+            return jsonify({"error": "Invalid 'cursor' parameter."}), 400
+
+        output = [render(row, fields, PHYSICAL_BOOK_FIELDS) for row in results]
+
+        return jsonify({'physical_books': output, 'next_cursor': next_cursor}), 200
     except Exception as e:
         logging.error(f'Failed to get physical books: {e}')
         return jsonify({'message': f'Failed to get physical books: {e}'}), 400
@@ -182,7 +407,7 @@ def get_physical_book(book_id):
             'idPhysicalBook': physical_book.idPhysicalBook,
             'ISBN': physical_book.ISBN,
             'Title': book.Title,
-            'Author': f"{author.LName}, {author.FName} {author.MName}",
+            'Author': f"{author.LName}, {author.FName} {author.MName or ''}".strip(),
             'Publisher': publisher.Name,
             'Edition': book.Edition,
             'Language': language.Name,
@@ -195,6 +420,65 @@ def get_physical_book(book_id):
         logging.error(f'Failed to get physical book: {e}')
         return jsonify({'message': f'Failed to get physical book: {e}'}), 400
 
+@bp.route('/<int:book_id>/scan', methods=['GET'])
+def scan_physical_book(book_id):
+    """
+    Endpoint for the desk barcode scan of a physical book
+    Reads only the copy row by primary key; the book title and author come from an in-process cache
+    ---
+    tags:
+        - PhysicalBooks
+    parameters:
+        - name: book_id
+          in: path
+          type: integer
+          required: true
+          description: Physical Book ID read from the barcode
+    responses:
+        200:
+            description: Physical Book successfully found
+            schema:
+                type: object
+                properties:
+                    idPhysicalBook:
+                        type: integer
+                    ISBN:
+                        type: string
+                    idBranch:
+                        type: integer
+                    Status:
+                        type: string
+                        example: AVAILABLE
+                    Title:
+                        type: string
+                    Author:
+                        type: string
+                    Edition:
+                        type: integer
+        404:
+            description: Physical Book not found
+        500:
+            description: Internal server error
+    """
+    try:
+        copy = db.session.execute(
+            select(PhysicalBook.idPhysicalBook, PhysicalBook.ISBN, PhysicalBook.idBranch, PhysicalBook.Status)
+            .where(PhysicalBook.idPhysicalBook == book_id)
+        ).first()
+        if not copy:
+            return jsonify({"error": "Physical Book not found"}), 404
+
+        return jsonify({
+            'idPhysicalBook': copy.idPhysicalBook,
+            'ISBN': copy.ISBN,
+            'idBranch': copy.idBranch,
+            'Status': copy.Status,
+            **get_scan_book_metadata(copy.ISBN)
+        }), 200
+    except Exception as e:
+        logging.error(f'Failed to scan physical book: {e}')
+        return jsonify({'message': f'Failed to scan physical book: {e}'}), 500
+
 @bp.route('/<int:book_id>', methods=['PUT', 'PATCH'])
 def update_physical_book(book_id):
     """
@@ -234,15 +518,18 @@ def update_physical_book(book_id):
         if not data:
             return jsonify({"error": "No data provided"}), 400
 
-        result = get_physical_book_by_id(book_id)
+        # Trava a linha (FOR UPDATE): os contadores se baseiam no Status lido aqui
+        physical_book = db.session.get(PhysicalBook, book_id, with_for_update=True, populate_existing=True)
 
-        if not result:
+        if not physical_book:
             return jsonify({"error": "Physical Book not found"}), 404
 
-        physical_book = result[0]
-
-        # Atualizar o livro
-        physical_book.idBranch = data.get("idBranch", physical_book.idBranch)
+        # Atualizar o livro (os contadores acompanham a troca de filial)
+        new_branch = data.get("idBranch", physical_book.idBranch)
+        if new_branch != physical_book.idBranch:
+            availability.move(physical_book.ISBN, physical_book.idBranch, from_status=physical_book.Status)
+            availability.move(physical_book.ISBN, new_branch, to_status=physical_book.Status)
+        physical_book.idBranch = new_branch
 
         db.session.commit()
         return jsonify({'message': 'Physical Book branch successfully updated'}), 200
@@ -275,16 +562,19 @@ def set_in_repair_physical_book(book_id):
 
     """
     try:
-        result = get_physical_book_by_id(book_id)
+        # Trava a linha (FOR UPDATE): duas chamadas simultâneas não movem os contadores duas vezes
+        physical_book = db.session.get(PhysicalBook, book_id, with_for_update=True, populate_existing=True)
 
-        if not result:
+        if not physical_book:
             return jsonify({"error": "Physical Book not found"}), 404
 
-        physical_book = result[0]
         if physical_book.Status != "IN REPAIR":
-            physical_book.Status = "IN REPAIR"
+            new_status = "IN REPAIR"
         else:
-            physical_book.Status = "AVAILABLE"
+            new_status = "AVAILABLE"
+
+        availability.move(physical_book.ISBN, physical_book.idBranch, physical_book.Status, new_status)
+        physical_book.Status = new_status
 
         db.session.commit()
         return jsonify({'message': 'Physical Book Status successfully changed.'}), 200
@@ -293,6 +583,324 @@ def set_in_repair_physical_book(book_id):
         logging.error(f'Failed to set physical book: {e}')
         return jsonify({'message': f'Failed to set physical book: {e}'}), 400
 
+@bp.route('/status', methods=['POST'])
+def set_physical_books_status():
+    """
+    Endpoint for changing the Status of many physical books at once (ex.: inventory audits)
+    Allowed changes: between AVAILABLE, IN REPAIR and LOST. BORROWED copies are never touched.
+    Every change is applied in one transaction; the response has the outcome of each id
+    ---
+    tags:
+        - PhysicalBooks
+    parameters:
+        - name: body
+          in: body
+          required: true
+          schema:
+            type: object
+            required:
+                - idPhysicalBooks
+                - Status
+            properties:
+                idPhysicalBooks:
+                    type: array
+                    items:
+                        type: integer
+                    example: [1, 2, 3]
+                    description: Physical Book ids (max 10000)
+                Status:
+                    type: string
+                    enum: ['AVAILABLE', 'IN REPAIR', 'LOST']
+                    example: LOST
+    responses:
+        200:
+            description: Status changes applied
+            schema:
+                type: object
+                properties:
+                    Status:
+                        type: string
+                    updated:
+                        type: integer
+                    results:
+                        type: array
+                        items:
+                            type: object
+                            properties:
+                                idPhysicalBook:
+                                    type: integer
+                                outcome:
+                                    type: string
+                                    enum: ['updated', 'unchanged', 'not_found', 'not_allowed']
+                                from:
+                                    type: string
+                                    description: Status before the change
+        400:
+            description: Invalid ids or Status
+        500:
+            description: Internal server error
+    """
+    data = request.get_json(silent=True) or {}
+    ids = data.get('idPhysicalBooks')
+    new_status = data.get('Status')
+
+    if new_status not in STATUS_TRANSITIONS:
+        return jsonify({'message': f"'Status' must be one of: {', '.join(STATUS_TRANSITIONS)}"}), 400
+    if not ids or not isinstance(ids, list) or not all(isinstance(i, int) for i in ids):
+        return jsonify({'message': "'idPhysicalBooks' must be a non-empty list of integers"}), 400
+    ids = list(dict.fromkeys(ids))
+    if len(ids) > STATUS_MAX_IDS:
+        return jsonify({'message': f'At most {STATUS_MAX_IDS} ids per request'}), 400
+
+    try:
+        # 1. Lemos e travamos (FOR UPDATE) os exemplares, para o Status não mudar até o commit
+        copies = {}
+        for start in range(0, len(ids), STATUS_CHUNK_SIZE):
+            chunk = ids[start:start + STATUS_CHUNK_SIZE]
+            copies.update((row.idPhysicalBook, row) for row in db.session.execute(
+                select(PhysicalBook.idPhysicalBook, PhysicalBook.ISBN, PhysicalBook.idBranch, PhysicalBook.Status)
+                .where(PhysicalBook.idPhysicalBook.in_(chunk))
+                .with_for_update()
+            ))
+
+        # 2. Validamos cada mudança
+        allowed = STATUS_TRANSITIONS[new_status]
+        changes = availability.AvailabilityChanges()
+        to_update = []
+        results = []
+        for ident in ids:
+            copy = copies.get(ident)
+            if copy is None:
+                results.append({'idPhysicalBook': ident, 'outcome': 'not_found'})
+            elif copy.Status == new_status:
+                results.append({'idPhysicalBook': ident, 'outcome': 'unchanged', 'from': copy.Status})
+            elif copy.Status not in allowed:
+                results.append({'idPhysicalBook': ident, 'outcome': 'not_allowed', 'from': copy.Status})
+            else:
+                results.append({'idPhysicalBook': ident, 'outcome': 'updated', 'from': copy.Status})
+                changes.move(copy.ISBN, copy.idBranch, copy.Status, new_status)
+                to_update.append(ident)
+
+        # 3. Um UPDATE por bloco de ids (o filtro de Status repete a validação no banco)
+        for start in range(0, len(to_update), STATUS_CHUNK_SIZE):
+            db.session.execute(
+                update(PhysicalBook)
+                .where(PhysicalBook.idPhysicalBook.in_(to_update[start:start + STATUS_CHUNK_SIZE]),
+                       PhysicalBook.Status.in_(allowed))
+                .values(Status=new_status)
+                .execution_options(synchronize_session=False)
+            )
+
+        changes.apply()
+        db.session.commit()
+
+        return jsonify({'Status': new_status, 'updated': len(to_update), 'results': results}), 200
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f'Failed to change physical books status: {e}')
+        return jsonify({'message': f'Failed to change physical books status: {e}'}), 500
+
+@bp.route('/transfer', methods=['POST'])
+def transfer_physical_books():
+    """
+    Endpoint for moving many physical books from one branch to another
+    Copies are given by id and/or as "N available copies of an ISBN".
+    All-or-nothing: one transaction, one set-based UPDATE per block of copies.
+    Returns the transfer manifest, grouped by book
+    ---
+    tags:
+        - PhysicalBooks
+    parameters:
+        - name: body
+          in: body
+          required: true
+          schema:
+            type: object
+            required:
+                - fromBranch
+                - toBranch
+            properties:
+                fromBranch:
+                    type: integer
+                    example: 1
+                toBranch:
+                    type: integer
+                    example: 2
+                idPhysicalBooks:
+                    type: array
+                    items:
+                        type: integer
+                    example: [10, 11]
+                    description: Copies to move (AVAILABLE or IN REPAIR, in fromBranch)
+                items:
+                    type: array
+                    description: Move 'quantity' AVAILABLE copies of each ISBN
+                    items:
+                        type: object
+                        properties:
+                            ISBN:
+                                type: string
+                                example: "9788599296578"
+                            quantity:
+                                type: integer
+                                example: 5
+    responses:
+        200:
+            description: Transfer done, manifest returned
+            schema:
+                type: object
+                properties:
+                    fromBranch:
+                        type: object
+                    toBranch:
+                        type: object
+                    TransferDate:
+                        type: string
+                    total:
+                        type: integer
+                    items:
+                        type: array
+                        items:
+                            type: object
+                            properties:
+                                ISBN:
+                                    type: string
+                                Title:
+                                    type: string
+                                quantity:
+                                    type: integer
+                                idPhysicalBooks:
+                                    type: array
+                                    items:
+                                        type: integer
+        400:
+            description: Invalid data
+        404:
+            description: Branch not found
+        409:
+            description: Some copies can't be moved (nothing was moved)
+        500:
+            description: Internal server error
+    """
+    data = request.get_json(silent=True) or {}
+    from_branch = data.get('fromBranch')
+    to_branch = data.get('toBranch')
+    ids = data.get('idPhysicalBooks') or []
+    items = data.get('items') or []
+
+    if not isinstance(from_branch, int) or not isinstance(to_branch, int) or from_branch == to_branch:
+        return jsonify({'message': "'fromBranch' and 'toBranch' must be two different branch ids"}), 400
+    if not isinstance(ids, list) or not all(isinstance(i, int) for i in ids):
+        return jsonify({'message': "'idPhysicalBooks' must be a list of integers"}), 400
+    if not isinstance(items, list) or not all(
+        isinstance(item, dict) and item.get('ISBN') and isinstance(item.get('quantity'), int) and item['quantity'] > 0
+        for item in items
+    ):
+        return jsonify({'message': "'items' must be a list of {ISBN, quantity} with a positive quantity"}), 400
+    if not ids and not items:
+        return jsonify({'message': "Send 'idPhysicalBooks' and/or 'items'"}), 400
+    ids = list(dict.fromkeys(ids))
+    if len(ids) + sum(item['quantity'] for item in items) > STATUS_MAX_IDS:
+        return jsonify({'message': f'At most {STATUS_MAX_IDS} copies per transfer'}), 400
+
+    try:
+        branches = {branch.idBranch: branch for branch in db.session.scalars(
+            select(Branch).where(Branch.idBranch.in_([from_branch, to_branch]))
+        )}
+        if len(branches) != 2:
+            return jsonify({'message': 'Branch not found'}), 404
+
+        columns = (PhysicalBook.idPhysicalBook, PhysicalBook.ISBN, PhysicalBook.Status)
+        copies = {}
+        errors = []
+
+        # 1. Exemplares pedidos por id: lidos e travados (FOR UPDATE) em blocos
+        for start in range(0, len(ids), STATUS_CHUNK_SIZE):
+            chunk = ids[start:start + STATUS_CHUNK_SIZE]
+            found = {row.idPhysicalBook: row for row in db.session.execute(
+                select(*columns, PhysicalBook.idBranch)
+                .where(PhysicalBook.idPhysicalBook.in_(chunk))
+                .with_for_update()
+            )}
+            for ident in chunk:
+                row = found.get(ident)
+                if row is None:
+                    errors.append({'idPhysicalBook': ident, 'error': 'not found'})
+                elif row.idBranch != from_branch:
+                    errors.append({'idPhysicalBook': ident, 'error': f'in branch {row.idBranch}'})
+                elif row.Status not in TRANSFER_STATUSES:
+                    errors.append({'idPhysicalBook': ident, 'error': f'Status {row.Status}'})
+                else:
+                    copies[ident] = row
+
+        # 2. "N exemplares disponíveis do ISBN": os de menor id, fora os já escolhidos por id
+        for item in items:
+            isbn = str(item['ISBN']).replace('-', '')
+            conditions = [
+                PhysicalBook.ISBN == isbn,
+                PhysicalBook.idBranch == from_branch,
+                PhysicalBook.Status == 'AVAILABLE'
+            ]
+            if copies:
+                conditions.append(PhysicalBook.idPhysicalBook.not_in(copies))
+            rows = db.session.execute(
+                select(*columns)
+                .where(*conditions)
+                .order_by(PhysicalBook.idPhysicalBook)
+                .limit(item['quantity'])
+                .with_for_update()
+            ).all()
+            if len(rows) < item['quantity']:
+                errors.append({'ISBN': isbn, 'error': f"only {len(rows)} of {item['quantity']} copies available"})
+            copies.update((row.idPhysicalBook, row) for row in rows)
+
+        if errors:
+            db.session.rollback()
+            return jsonify({'message': 'Nothing was transferred', 'errors': errors}), 409
+
+        # 3. Troca de filial em massa, com os contadores acompanhando
+        moved = sorted(copies)
+        changes = availability.AvailabilityChanges()
+        for row in copies.values():
+            changes.move(row.ISBN, from_branch, from_status=row.Status)
+            changes.move(row.ISBN, to_branch, to_status=row.Status)
+
+        for start in range(0, len(moved), STATUS_CHUNK_SIZE):
+            db.session.execute(
+                update(PhysicalBook)
+                .where(PhysicalBook.idPhysicalBook.in_(moved[start:start + STATUS_CHUNK_SIZE]),
+                       PhysicalBook.idBranch == from_branch)
+                .values(idBranch=to_branch)
+                .execution_options(synchronize_session=False)
+            )
+
+        changes.apply()
+
+        # 4. Manifesto agrupado por livro
+        by_isbn = {}
+        for ident in moved:
+            by_isbn.setdefault(copies[ident].ISBN, []).append(ident)
+        titles = dict(db.session.execute(
+            select(Book.ISBN, Book.Title).where(Book.ISBN.in_(by_isbn))
+        ).all())
+
+        db.session.commit()
+
+        return jsonify({
+            'fromBranch': {'idBranch': from_branch, 'BranchName': branches[from_branch].BranchName},
+            'toBranch': {'idBranch': to_branch, 'BranchName': branches[to_branch].BranchName},
+            'TransferDate': datetime.now().isoformat(timespec='seconds'),
+            'total': len(moved),
+            'items': [
+                {'ISBN': isbn, 'Title': titles.get(isbn), 'quantity': len(idents), 'idPhysicalBooks': idents}
+                for isbn, idents in sorted(by_isbn.items())
+            ]
+        }), 200
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f'Failed to transfer physical books: {e}')
+        return jsonify({'message': f'Failed to transfer physical books: {e}'}), 500
+
 def get_physical_book_by_id(book_id):
     return db.session.query(
         PhysicalBook,
@@ -310,7 +918,72 @@ def get_physical_book_by_id(book_id):
     ).join(
         Publisher, Book.idPublisher == Publisher.idPublisher
     ).join(
-        Language, Book.idLanguage == Language.idLanguage
+        Language, Book.Language == Language.idLanguage
     ).filter(
         PhysicalBook.idPhysicalBook == book_id,
-        ).first()  # .first() pega apenas um
\ No newline at end of file
+        ).first()  # .first() pega apenas um
+
+def get_scan_book_metadata(isbn):
+    """
+    Title, Author and Edition of a book, from scan_book_cache
+    (on a miss, one primary-key query of Book and Author)
+    """
+    metadata = scan_book_cache.get(isbn)
+    if metadata is None:
+        generation = scan_book_cache.generation()
+        row = db.session.query(
+            Book.Title,
+            Book.Edition,
+            Author.FName,
+            Author.MName,
+            Author.LName
+        ).join(
+            Author, Book.idAuthor == Author.idAuthor
+        ).filter(
+            Book.ISBN == isbn
+        ).first()
+
+        metadata = {
+            'Title': row.Title,
+            'Author': f"{row.LName}, {row.FName} {row.MName or ''}".strip(),
+            'Edition': row.Edition
+        }
+        scan_book_cache.set(isbn, metadata, generation=generation)
+
+    return metadata
+
+def insert_physical_books(isbn, id_branch, quantity):
+    """
+    Insert 'quantity' AVAILABLE copies with a single multi-row INSERT (does not commit)
+    :return: <list> generated idPhysicalBook, ascending
+    """
+    rows = [{'ISBN': isbn, 'idBranch': id_branch, 'Status': 'AVAILABLE'}] * quantity
+
+    if db.engine.dialect.insert_returning:
+        stmt = insert(PhysicalBook).values(rows).returning(PhysicalBook.idPhysicalBook)
+        return sorted(db.session.scalars(stmt))
+
+    # MySQL não tem RETURNING: o lastrowid de um INSERT de várias linhas é o primeiro id gerado.
+    # Os ids podem não ser consecutivos (innodb_autoinc_lock_mode=2), então relemos os nossos:
+    # a transação já fez leituras antes do INSERT, e o snapshot não enxerga linhas de outras transações.
+    result = db.session.execute(insert(PhysicalBook).values(rows))
+    return list(db.session.scalars(
+        select(PhysicalBook.idPhysicalBook).where(
+            PhysicalBook.idPhysicalBook >= result.lastrowid,
+            PhysicalBook.ISBN == isbn,
+            PhysicalBook.idBranch == id_branch
+        ).order_by(PhysicalBook.idPhysicalBook).limit(quantity)
+    ))
+
+def id_ranges(ids):
+    """
+    Compress ascending ids in [first, last] ranges
+    [1, 2, 3, 7, 8] -> [[1, 3], [7, 8]]
+    """
+    ranges = []
+    for ident in ids:
+        if ranges and ident == ranges[-1][1] + 1:
+            ranges[-1][1] = ident
+        else:
+            ranges.append([ident, ident])
+    return ranges
@@ -1,10 +1,12 @@
 import logging
 
-from flask import Blueprint, jsonify
+from flask import Blueprint, jsonify, request
 from datetime import date
 
 from .. import db
-from ..models import BookLoan, Client, ClientFP, ClientJP, PhysicalBook, Book
+from ..pagination import parse_limit
+from ..reconcile import DEFAULT_CHUNK_SIZE, reconcile_inventory
+from ..models import BookLoan, Client, ClientFP, ClientJP, OverdueLoan, PhysicalBook, Book
 
 # 'Blueprint' é como organizamos um grupo de rotas
 bp = Blueprint('reports', __name__, url_prefix='/api/reports')
@@ -14,6 +16,7 @@ bp = Blueprint('reports', __name__, url_prefix='/api/reports')
 def get_overdue_loans():
     """
     Return overdue loans due dates
+    Reads the loans marked by the daily overdue scan ('flask scan-overdue')
     ---
     tags:
         - Reports
@@ -27,8 +30,8 @@ def get_overdue_loans():
         today = date.today()
 
         # Consulta:
-        # 1. Status deve ser 'ACTIVE'
-        # 2. DueDate deve ser menor que hoje
+        # Parte da tabela OverdueLoan, mantida pelo 'flask scan-overdue' (ver overdue.py),
+        # que já tem só os empréstimos ACTIVE com DueDate vencida
         query = db.session.query(
             BookLoan,
             Client,
@@ -36,6 +39,10 @@ def get_overdue_loans():
             ClientJP,
             PhysicalBook,
             Book
+        ).select_from(
+            OverdueLoan
+        ).join(
+            BookLoan, OverdueLoan.idBookLoan == BookLoan.idBookLoan
         ).join(
             Client, BookLoan.idClient == Client.idClient
         ).outerjoin(
@@ -47,8 +54,7 @@ def get_overdue_loans():
         ).join(
             Book, PhysicalBook.ISBN == Book.ISBN
         ).filter(
-            BookLoan.Status == 'ACTIVE',
-            BookLoan.DueDate < today
+            BookLoan.Status == 'ACTIVE'
         )
 
         results = query.all()
@@ -78,4 +84,60 @@ def get_overdue_loans():
         return jsonify({'overdue_loans': output, 'count': len(output)}), 200
     except Exception as e:
         logging.error(f"Failed to get overdue report: {e}")
-        return jsonify({'error': f"Failed to get overdue report: {e}"}), 500
\ No newline at end of file
+        return jsonify({'error': f"Failed to get overdue report: {e}"}), 500
+
+
+@bp.route('/inventory-consistency', methods=['GET', 'POST'])
+def check_inventory_consistency():
+    """
+    Compare every copy Status with its ACTIVE loans
+    GET only reports; POST also fixes what has a safe repair
+    (BORROWED copy without loan -> AVAILABLE, ACTIVE loan on AVAILABLE copy -> copy BORROWED,
+    ACTIVE loan on LOST copy -> loan LOST). Copies are read in primary-key chunks,
+    one short transaction per chunk
+    ---
+    tags:
+        - Reports
+    parameters:
+        - name: chunk_size
+          in: query
+          type: integer
+          default: 1000
+          description: Copies read per chunk (max 10000)
+    responses:
+        200:
+            description: Report successfully retrieved
+            schema:
+                type: object
+                properties:
+                    checked_copies:
+                        type: integer
+                    checked_loans:
+                        type: integer
+                    issues:
+                        type: object
+                        description: Count by issue type
+                    repaired:
+                        type: integer
+                    details:
+                        type: array
+                        description: First 1000 issues found
+                        items:
+                            type: object
+        400:
+            description: Invalid 'chunk_size' parameter
+        500:
+            description: Internal server error
+    """
+    try:
+        chunk_size = parse_limit(request.args.get('chunk_size'), default=DEFAULT_CHUNK_SIZE, maximum=10000)
+    except ValueError:
+        return jsonify({"error": "Invalid 'chunk_size' parameter. Use a positive integer."}), 400
+
+    try:
+        report = reconcile_inventory(repair=request.method == 'POST', chunk_size=chunk_size)
+        return jsonify(report), 200
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Failed to check inventory consistency: {e}")
+        return jsonify({'error': f"Failed to check inventory consistency: {e}"}), 500
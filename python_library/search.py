@@ -0,0 +1,398 @@
+import bisect
+import logging
+import re
+from collections import Counter, defaultdict
+import threading
+import time
+import unicodedata
+
+from flask import current_app
+from sqlalchemy.dialects.mysql import match
+
+from . import db
+from .models import Author, Book
+
+# O InnoDB ignora tokens menores que 'innodb_ft_min_token_size' (padrão 3)
+FULLTEXT_MIN_TOKEN = 3
+
+# Segundos até os índices em memória serem recarregados do banco. Cada processo só vê as
+# alterações feitas por ele mesmo; o recarregamento traz as de outros workers e da importação.
+INDEX_RELOAD_TTL = 600
+
+# Um recarregamento por vez: as demais requisições continuam com o índice antigo
+_reload_lock = threading.Lock()
+
+# Extrai só as palavras: operadores do modo booleano (+ - * " etc.) não podem vir do usuário
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def fulltext_enabled():
+    """Return True when the database can answer MATCH ... AGAINST queries"""
+    return db.engine.dialect.name == 'mysql'
+
+
+def boolean_query(term):
+    """
+    Turn a free text term into a MySQL boolean mode query.
+    Every word is required and matched as a prefix: "lord ring" -> "+lord* +ring*"
+    :param term: <str> text typed by the user
+    :return: <str> boolean query, or None if no word is long enough to be indexed
+    """
+    words = [w for w in _TOKEN_RE.findall(term) if len(w) >= FULLTEXT_MIN_TOKEN]
+    if not words:
+        return None
+
+    return ' '.join(f"+{w}*" for w in words)
+
+
+def fulltext_match(columns, term):
+    """
+    Build a MATCH (columns) AGAINST (term IN BOOLEAN MODE) expression.
+    The columns must be covered by one FULLTEXT index (see models.py).
+    Used both as filter and as relevance score.
+    :param columns: <list> columns of the FULLTEXT index
+    :param term: <str> text typed by the user
+    :return: match expression, or None when the full-text index can't answer it
+    """
+    if not fulltext_enabled():
+        return None
+
+    query = boolean_query(term)
+    if query is None:
+        return None
+
+    return match(*columns, against=query).in_boolean_mode()
+
+
+def normalize(text):
+    """
+    Normalize text for in-memory matching: no accents, case folded, single spaces
+    "  São   Paulo " -> "sao paulo"
+    """
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    stripped = ''.join(c for c in decomposed if not unicodedata.combining(c))
+    return ' '.join(stripped.casefold().split())
+
+
+class PrefixIndex:
+    """
+    Sorted in-memory index answering prefix queries with a binary search.
+    Each entry is identified by (kind, id) and can have several keys
+    (ex.: an author is found by "first last" and by "last first").
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._keys = []      # [(key, kind, id)] sempre ordenada
+        self._entries = {}   # (kind, id) -> (label, [keys])
+        self.loaded = False
+        self.loaded_at = None
+
+    def load(self, entries):
+        """
+        Replace the whole index
+        :param entries: iterable of (kind, id, label, keys)
+        """
+        keys = []
+        labels = {}
+        for kind, ident, label, entry_keys in entries:
+            entry_keys = [k for k in entry_keys if k]
+            labels[(kind, ident)] = (label, entry_keys)
+            keys.extend((k, kind, ident) for k in entry_keys)
+        keys.sort()
+
+        with self._lock:
+            self._keys = keys
+            self._entries = labels
+            self.loaded = True
+            self.loaded_at = time.monotonic()
+
+    def put(self, kind, ident, label, keys):
+        """Insert or replace one entry"""
+        with self._lock:
+            self._remove(kind, ident)
+            keys = [k for k in keys if k]
+            self._entries[(kind, ident)] = (label, keys)
+            for key in keys:
+                bisect.insort(self._keys, (key, kind, ident))
+
+    def remove(self, kind, ident):
+        """Remove one entry, if present"""
+        with self._lock:
+            self._remove(kind, ident)
+
+    def _remove(self, kind, ident):
+        entry = self._entries.pop((kind, ident), None)
+        if entry is None:
+            return
+        for key in entry[1]:
+            i = bisect.bisect_left(self._keys, (key, kind, ident))
+            if i < len(self._keys) and self._keys[i] == (key, kind, ident):
+                del self._keys[i]
+
+    def search(self, prefix, limit=10):
+        """
+        Return up to 'limit' entries with a key starting with 'prefix'
+        :param prefix: <str> already normalized prefix
+        :return: <list> of (kind, id, label), ordered by key
+        """
+        results = []
+        seen = set()
+        with self._lock:
+            i = bisect.bisect_left(self._keys, (prefix,))
+            while i < len(self._keys) and len(results) < limit:
+                key, kind, ident = self._keys[i]
+                if not key.startswith(prefix):
+                    break
+                if (kind, ident) not in seen:
+                    seen.add((kind, ident))
+                    results.append((kind, ident, self._entries[(kind, ident)][0]))
+                i += 1
+
+        return results
+
+
+
+def trigrams(text):
+    """
+    Split a text in trigrams, word by word, like PostgreSQL's pg_trgm
+    "Sao" -> {"  s", " sa", "sao", "ao "}
+    """
+    grams = set()
+    for word in normalize(text).split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class TrigramIndex:
+    """
+    In-memory trigram index for accent-insensitive, typo-tolerant matching.
+    Only entries sharing at least one trigram with the query are scored.
+    """
+
+    # Fração mínima dos trigramas da busca que precisa existir no texto
+    THRESHOLD = 0.5
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._postings = defaultdict(set)    # trigrama -> {id}
+        self._entries = {}                   # id -> (label, trigramas)
+        self.loaded = False
+        self.loaded_at = None
+
+    def load(self, entries):
+        """
+        Replace the whole index
+        :param entries: iterable of (id, label, text)
+        """
+        postings = defaultdict(set)
+        labels = {}
+        for ident, label, text in entries:
+            grams = trigrams(text)
+            labels[ident] = (label, grams)
+            for gram in grams:
+                postings[gram].add(ident)
+
+        with self._lock:
+            self._postings = postings
+            self._entries = labels
+            self.loaded = True
+            self.loaded_at = time.monotonic()
+
+    def put(self, ident, label, text):
+        """Insert or replace one entry"""
+        with self._lock:
+            self._remove(ident)
+            grams = trigrams(text)
+            self._entries[ident] = (label, grams)
+            for gram in grams:
+                self._postings[gram].add(ident)
+
+    def remove(self, ident):
+        """Remove one entry, if present"""
+        with self._lock:
+            self._remove(ident)
+
+    def _remove(self, ident):
+        entry = self._entries.pop(ident, None)
+        if entry is None:
+            return
+        for gram in entry[1]:
+            posting = self._postings.get(gram)
+            if posting is None:
+                continue
+            posting.discard(ident)
+            # Trigramas sem nenhum texto saem do índice (não acumulam chaves vazias)
+            if not posting:
+                del self._postings[gram]
+
+    def search(self, text, limit=20):
+        """
+        Return the entries most similar to 'text'
+        Ranked by the fraction of the query trigrams found in the entry,
+        then by the overall similarity (to prefer shorter, closer texts)
+        :return: <list> of (id, label, score)
+        """
+        query = trigrams(text)
+        if not query:
+            return []
+
+        shared = Counter()
+        with self._lock:
+            for gram in query:
+                shared.update(self._postings.get(gram, ()))
+
+            results = []
+            for ident, count in shared.items():
+                score = count / len(query)
+                if score < self.THRESHOLD:
+                    continue
+                label, grams = self._entries[ident]
+                similarity = count / (len(query) + len(grams) - count)
+                results.append((score, similarity, ident, label))
+
+        results.sort(key=lambda r: (-r[0], -r[1]))
+        return [(ident, label, round(score, 3)) for score, _, ident, label in results[:limit]]
+
+# Índice de sugestões (typeahead) de títulos e autores.
+# É carregado do banco na primeira consulta, mantido pelas rotas de Book e Author
+# e recarregado em segundo plano depois de INDEX_RELOAD_TTL.
+suggestions = PrefixIndex()
+
+# Índices de busca aproximada (sem acento, tolerante a erros de digitação).
+# Também carregados na primeira consulta e mantidos pelas mesmas rotas.
+fuzzy_titles = TrigramIndex()
+fuzzy_authors = TrigramIndex()
+
+
+def _author_name(author):
+    return f"{author.LName}, {author.FName} {author.MName or ''}".strip()
+
+
+def _book_entry(isbn, title):
+    return 'book', isbn, title, [normalize(title)]
+
+
+def _author_entry(author):
+    first_last = normalize(f"{author.FName} {author.LName}")
+    last_first = normalize(f"{author.LName} {author.FName}")
+    return 'author', author.idAuthor, _author_name(author), [first_last, last_first]
+
+
+def _author_fuzzy_entry(author):
+    return author.idAuthor, _author_name(author), f"{author.FName} {author.MName or ''} {author.LName}"
+
+
+def _is_current(index):
+    """True when the index was loaded less than INDEX_RELOAD_TTL seconds ago"""
+    return index.loaded and time.monotonic() - index.loaded_at < INDEX_RELOAD_TTL
+
+
+def _active_books():
+    return db.session.query(Book.ISBN, Book.Title).filter(Book.is_active == True)
+
+
+def _active_authors():
+    return db.session.query(
+        Author.idAuthor, Author.FName, Author.MName, Author.LName
+    ).filter(Author.is_active == True)
+
+
+def _load_suggestions():
+    entries = [_book_entry(isbn, title) for isbn, title in _active_books()]
+    entries.extend(_author_entry(author) for author in _active_authors())
+    suggestions.load(entries)
+
+
+def _load_fuzzy():
+    fuzzy_titles.load((isbn, title, title) for isbn, title in _active_books())
+    fuzzy_authors.load(_author_fuzzy_entry(author) for author in _active_authors())
+
+
+def _reload_in_background(app, loader):
+    """Run loader in its own app context, releasing _reload_lock at the end"""
+    try:
+        with app.app_context():
+            try:
+                loader()
+            except Exception as e:
+                logging.error(f"Failed to reload search indexes: {e}")
+            finally:
+                db.session.remove()
+    finally:
+        _reload_lock.release()
+
+
+def _ensure_loaded(indexes, loader):
+    """
+    Load the indexes on first use, and refresh them after INDEX_RELOAD_TTL
+    The first load blocks (there is nothing to answer with yet), but only one thread runs it.
+    An expired index is refreshed by one background thread while requests keep using the old one
+    """
+    if all(_is_current(index) for index in indexes):
+        return
+
+    if all(index.loaded for index in indexes):
+        # Vencido: se ninguém estiver recarregando, recarrega fora da requisição
+        if _reload_lock.acquire(blocking=False):
+            app = current_app._get_current_object()
+            threading.Thread(
+                target=_reload_in_background, args=(app, loader), name='search-index-reload', daemon=True
+            ).start()
+        return
+
+    with _reload_lock:
+        # Quem esperou a trava encontra o índice já carregado por outra thread
+        if not all(index.loaded for index in indexes):
+            loader()
+
+
+def ensure_suggestions_loaded():
+    """Build the suggestions index from the database on first use (and refresh it after INDEX_RELOAD_TTL)"""
+    _ensure_loaded([suggestions], _load_suggestions)
+
+
+def ensure_fuzzy_loaded():
+    """Build the trigram indexes from the database on first use (and refresh them after INDEX_RELOAD_TTL)"""
+    _ensure_loaded([fuzzy_titles, fuzzy_authors], _load_fuzzy)
+
+
+def index_book(book):
+    """Keep the in-memory indexes in sync after a book was committed"""
+    if suggestions.loaded:
+        if book.is_active:
+            suggestions.put(*_book_entry(book.ISBN, book.Title))
+        else:
+            suggestions.remove('book', book.ISBN)
+
+    if fuzzy_titles.loaded:
+        if book.is_active:
+            fuzzy_titles.put(book.ISBN, book.Title, book.Title)
+        else:
+            fuzzy_titles.remove(book.ISBN)
+
+
+def index_author(author):
+    """Keep the in-memory indexes in sync after an author was committed"""
+    if suggestions.loaded:
+        if author.is_active:
+            suggestions.put(*_author_entry(author))
+        else:
+            suggestions.remove('author', author.idAuthor)
+
+    if fuzzy_authors.loaded:
+        if author.is_active:
+            fuzzy_authors.put(*_author_fuzzy_entry(author))
+        else:
+            fuzzy_authors.remove(author.idAuthor)
+
+
+def reset_indexes():
+    """
+    Drop the in-memory indexes after bulk changes (ex.: catalog import);
+    they are rebuilt from the database on the next query
+    """
+    suggestions.loaded = False
+    fuzzy_titles.loaded = False
+    fuzzy_authors.loaded = False
@@ -5,7 +5,8 @@ from faker import Faker
 from . import db
 from .models import (
     Address, Branch, Publisher, Author, Language, Collection,
-    Book, PhysicalBook, Client, ClientFP, ClientJP, BookLoan, Reserve
+    Book, PhysicalBook, Client, ClientFP, ClientJP, BookLoan, Reserve, BookAvailability, OverdueLoan,
+    FinePolicy, LoanFine
 )
 
 # Inicializa o Faker para gerar dados em português
@@ -28,8 +29,12 @@ def register_seed_command(app):
             # Deleta em ordem inversa das dependências
             print("Limpando dados antigos...")
             db.session.query(Reserve).delete()
+            db.session.query(OverdueLoan).delete()
+            db.session.query(LoanFine).delete()
             db.session.query(BookLoan).delete()
+            db.session.query(BookAvailability).delete()
             db.session.query(PhysicalBook).delete()
+            db.session.query(FinePolicy).delete()
             db.session.query(Book).delete()
             db.session.query(Collection).delete()
             db.session.query(Language).delete()
@@ -67,6 +72,12 @@ def register_seed_command(app):
             db.session.add_all([branch1, branch2])
             branches = [branch1, branch2]
 
+            # Regras de multa por atraso (a filial do bairro tem carência e teto)
+            db.session.add_all([
+                FinePolicy(branch=branch1, DailyRate=1.00, GraceDays=0),
+                FinePolicy(branch=branch2, DailyRate=0.50, GraceDays=2, MaxFine=20.00)
+            ])
+
             # --- 3. Editoras (Publishers) (3) ---
             pub1 = Publisher(Name="Editora Fantasia", CNPJ=fake.cnpj().replace('.','').replace('/','').replace('-',''), address=addresses.pop())
             pub2 = Publisher(Name="Livros Acadêmicos", CNPJ=fake.cnpj().replace('.','').replace('/','').replace('-',''), address=addresses.pop())
@@ -313,6 +324,18 @@ def register_seed_command(app):
 
             # Comita tudo
             db.session.commit()
+
+            # Contadores de disponibilidade por livro/filial
+            from .availability import rebuild
+            rebuild()
+
+            # Empréstimos atrasados
+            from .overdue import scan_overdue
+            scan_overdue()
+
+            # Multas dos empréstimos atrasados
+            from .fines import calculate_fines
+            calculate_fines()
             print(f">>> Banco de dados populado com sucesso!")
             print(f"    Criados {len(clients)} clientes, {len(books)} livros, {len(physical_books)} exemplares.")
 
@@ -0,0 +1,106 @@
+import datetime
+import threading
+
+import pytest
+
+from python_library import create_app, db
+from python_library.availability import rebuild
+from python_library.models import (
+    Address, Author, Book, BookAvailability, BookLoan, Branch, Client, ClientFP, Language, PhysicalBook, Publisher
+)
+
+THREADS = 16
+ISBN = '9780000000001'
+
+# Coluna do contador de cada Status de PhysicalBook
+COUNTERS = {'AVAILABLE': 'Available', 'BORROWED': 'Borrowed', 'IN REPAIR': 'InRepair', 'LOST': 'Lost'}
+
+
+@pytest.fixture
+def app(tmp_path):
+    """App on a file-backed SQLite database, so every thread gets its own connection"""
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'library.db'}",
+        'SQLALCHEMY_ENGINE_OPTIONS': {'connect_args': {'timeout': 30, 'check_same_thread': False}},
+    })
+
+    with app.app_context():
+        seed()
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+
+def seed():
+    address = Address(Road='Rua', Neighbourhood='Centro', City='Cidade', State='SP', ZipCode='00000000')
+    db.session.add(address)
+    db.session.flush()
+
+    db.session.add_all([
+        Language(idLanguage=1, Code='pt', Name='Português'),
+        Author(idAuthor=1, FName='Jorge', LName='Amado'),
+        Publisher(idPublisher=1, CNPJ='1', Name='Editora', idAddress=address.idAddress),
+        Branch(idBranch=1, BranchName='Central', idAddress=address.idAddress),
+        Client(idClient=1, Type='PF', idAddress=address.idAddress),
+    ])
+    db.session.flush()
+
+    db.session.add_all([
+        Book(ISBN=ISBN, Title='Capitães da Areia', idAuthor=1, idPublisher=1, Language=1, AgeRange=12),
+        ClientFP(idClient=1, CPF='1', FName='Ana', LName='Lima', Birthdate=datetime.date(1990, 1, 1)),
+    ])
+    db.session.flush()
+
+    db.session.add_all([PhysicalBook(ISBN=ISBN, idBranch=1) for _ in range(2)])
+    db.session.commit()
+    rebuild()
+
+
+def checkout_concurrently(app, id_physical_book):
+    """POST /api/loans/ for the same copy from THREADS threads at once; returns the status codes"""
+    barrier = threading.Barrier(THREADS)
+    codes = []
+
+    def worker():
+        client = app.test_client()
+        barrier.wait()
+        response = client.post('/api/loans/', json={'idClient': 1, 'idPhysicalBook': id_physical_book})
+        codes.append(response.status_code)
+
+    threads = [threading.Thread(target=worker) for _ in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return codes
+
+
+def test_concurrent_checkout_lends_copy_once(app):
+    codes = checkout_concurrently(app, 1)
+
+    assert codes.count(201) == 1
+    assert codes.count(409) == THREADS - 1
+
+    db.session.expire_all()
+    active = db.session.execute(
+        db.select(BookLoan).where(BookLoan.idPhysicalBook == 1, BookLoan.Status == 'ACTIVE')
+    ).scalars().all()
+    assert len(active) == 1
+    assert db.session.get(PhysicalBook, 1).Status == 'BORROWED'
+    assert db.session.get(PhysicalBook, 2).Status == 'AVAILABLE'
+
+
+def test_concurrent_checkout_keeps_availability_counters(app):
+    for id_physical_book in (1, 2):
+        checkout_concurrently(app, id_physical_book)
+
+    db.session.expire_all()
+    counters = db.session.get(BookAvailability, (ISBN, 1))
+    statuses = db.session.execute(
+        db.select(PhysicalBook.Status).where(PhysicalBook.ISBN == ISBN, PhysicalBook.idBranch == 1)
+    ).scalars().all()
+
+    for status, column in COUNTERS.items():
+        assert getattr(counters, column) == statuses.count(status), status
+    assert statuses.count('BORROWED') == 2